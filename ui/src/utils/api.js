@@ -22,7 +22,7 @@ export function createReducer(prefix, initialData, responseReducer) {
   }
 
   function fetch(query, dispatch) {
-    axios.post('/q', {query})
+    post(query)
       .then(response => {
         dispatch({type: prefix + '_SUCCESS', data: responseReducer(response.data)});
       })
@@ -47,3 +47,23 @@ export function createReducer(prefix, initialData, responseReducer) {
 
   return {reducer, load, reset};
 }
+
+function sha256(text) {
+  return crypto.subtle.digest('SHA-256', new TextEncoder().encode(text))
+    .then(buffer => Array.from(new Uint8Array(buffer), b => b.toString(16).padStart(2, '0')).join(''));
+}
+
+function post(query) {
+  if (!window.crypto || !crypto.subtle)
+    return axios.post('/q', {query});
+  // sends the hash only, and the full query once the server asks for it
+  return sha256(query).then(hash => {
+    const extensions = {persistedQuery: {version: 1, sha256Hash: hash}};
+    return axios.post('/q', {extensions}).then(response => {
+      const errors = response.data.errors;
+      if (errors && errors.some(error => error.message === 'PersistedQueryNotFound'))
+        return axios.post('/q', {query, extensions});
+      return response;
+    });
+  });
+}
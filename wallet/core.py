@@ -31,6 +31,9 @@ def _init_configurations(app):
         SQLALCHEMY_DATABASE_URI=environ['DATABASE_URL'],
         SQLALCHEMY_ECHO=app.debug,
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        SLOW_QUERY_MS=int(environ.get('SLOW_QUERY_MS', 200)),
+        GRAPHQL_SLOW_MS=int(environ.get('GRAPHQL_SLOW_MS', 500)),
+        GRAPHQL_PROFILE_RATE=float(environ.get('GRAPHQL_PROFILE_RATE', 0)),
     )
     for key in [
         'M1_TOKEN', 'RH_TOKEN', 'SWAPSY_USERNAME', 'SWAPSY_PASSWORD',
@@ -69,23 +72,34 @@ def _init_components(app, compact):
 def _init_models(app):
     from wallet.model.user import User
     from wallet.model.account import Account, AccountType
+    from wallet.model.balance import AccountBalance
     from wallet.model.category import Category
+    from wallet.model.spending import CategorySpending
     from wallet.model.transaction import Transaction
     from wallet.model.entry import Entry
     from wallet.model.enums import Currency, Timezone
+    from wallet.model.exchange_rate import ExchangeRate
     from wallet.model.m1 import M1Portfolio
+    from wallet.model.net_worth import BalanceHistory
+    from wallet.model.option import OptionInstrument, OptionSnapshot
     from wallet.util.swapsy import init_app as swapsy_init_app, exchange_rate
     from wallet.util.google_drive import init_app as google_drive_init_app
     from wallet.util.robinhood import init_app as robinhood_init_app
+    from wallet.model.statement import init_app as statement_init_app
+    from wallet.util.ledger_version import init_app as ledger_version_init_app
+    from wallet.util.instrumentation import init_app as instrumentation_init_app
     models = [
-        User, Account, Category, Transaction, Entry,
+        User, Account, AccountBalance, Category, CategorySpending, Transaction, Entry,
         Currency, Timezone, AccountType,
-        M1Portfolio, exchange_rate,
+        M1Portfolio, ExchangeRate, BalanceHistory, OptionInstrument, OptionSnapshot, exchange_rate,
     ]
     [m.init_app(app) for m in models if hasattr(m, 'init_app')]
     swapsy_init_app(app)
     google_drive_init_app(app)
     robinhood_init_app(app)
+    statement_init_app(app)
+    ledger_version_init_app(app)
+    instrumentation_init_app(app)  # before the worker forks, so the slow queries of jobs are logged too
     return models
 
 
@@ -118,16 +132,20 @@ def _init_worker(app):
 
 def _init_views(app):
     from flask_login import login_required
-    from flask_graphql import GraphQLView
     from wallet.view.frontend import bp as frontend_bp
     from wallet.view.auth import bp as auth_bp, login_manager
     from wallet.view.plivo import bp as plivo_bp
     from wallet.view.graphql.schema import schema
+    from wallet.view.graphql.profiler import ResolverProfiler, init_app as profiler_init_app
+    from wallet.view.graphql.view import LedgerGraphQLView, ValidatedBackend
+    from wallet.view.stats import bp as stats_bp
+    profiler_init_app(app)
     app.register_blueprint(frontend_bp)
     app.register_blueprint(auth_bp)
     app.register_blueprint(plivo_bp, url_prefix='/plivo')
-    app.add_url_rule('/q', view_func=login_required(
-        GraphQLView.as_view('graphql', schema=schema, graphiql=app.debug)))
+    app.register_blueprint(stats_bp, url_prefix='/stats')
+    app.add_url_rule('/q', view_func=login_required(LedgerGraphQLView.as_view(
+        'graphql', schema=schema, graphiql=app.debug, backend=ValidatedBackend(), middleware=[ResolverProfiler()])))
     login_manager.init_app(app)
 
 
@@ -156,7 +174,15 @@ def no_autoflush(func):
     return wrapper
 
 
+def keyset_page(query, columns, after, size):
+    if after:
+        query = query.filter(db.tuple_(*columns) < tuple(after))
+    items = query.order_by(*(column.desc() for column in columns)).limit(size + 1).all()
+    return items[:size], len(items) > size
+
+
 db.utcnow = datetime.utcnow
 db.save = lambda e: db.session.add(e) or e
 db.IntEnum = IntEnum
 db.no_autoflush = no_autoflush
+db.keyset_page = keyset_page
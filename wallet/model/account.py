@@ -1,9 +1,12 @@
 from enum import IntEnum
 
 from flask_sqlalchemy import BaseQuery
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
 
 from wallet.core import db
-from wallet.model.entry import Entry
+from wallet.model.balance import AccountBalance
 from wallet.model.enums import Currency
 
 
@@ -40,6 +43,7 @@ class Account(db.Model):
     # relationships
     user = db.relationship('User', foreign_keys=[user_id])
     _entries = db.relationship('Entry', back_populates='account', lazy='dynamic')
+    balances = db.relationship('AccountBalance', back_populates='account')
     # metadata
     __table_args__ = (
         db.UniqueConstraint('user_id', 'name', name='account_user_name_key'),
@@ -58,6 +62,36 @@ class Account(db.Model):
     def active_entries(self):
         return self._entries.filter_by(active=True).all()
 
+    def adjust_balance(self, currency, amount, count=0):
+        balance = self._locked_balance(currency)
+        balance.amount = round(balance.amount + amount, 2)
+        balance.entry_count += count
+        return balance
+
+    def _locked_balance(self, currency):
+        """
+        The balance row, locked until the end of the transaction the first time it is adjusted in it, so concurrent
+        writers (web and workers) wait for each other instead of losing updates. The row of a new account is not
+        visible to others yet, and the missing row of an existing one is inserted first if nobody else has.
+        """
+        if self.id is None:
+            balance = next((b for b in self.balances if b.currency == currency), None)
+            return balance or AccountBalance(account=self, currency=currency, amount=0, entry_count=0)
+        locked = db.session.info.setdefault('locked_balances', {})
+        if (self.id, currency) not in locked:
+            db.session.execute(insert(AccountBalance).values(
+                account_id=self.id, currency=currency, amount=0, entry_count=0, updated=db.utcnow(),
+            ).on_conflict_do_nothing(constraint='account_balance_account_currency_key'))
+            locked[self.id, currency] = (AccountBalance.query.filter_by(account_id=self.id, currency=currency)
+                                         .populate_existing().with_for_update().one())  # flushed before refreshing
+            db.session.expire(self, ['balances'])
+        return locked[self.id, currency]
+
+    @classmethod
+    def init_app(cls, _):
+        event.listen(Session, 'after_transaction_end', _release_balances)
+        event.listen(Session, 'after_soft_rollback', _forget_balances)
+
     @classmethod
     def create(cls, user, name, type_):
         return db.save(cls(user=user, name=name, type=type_))
@@ -70,10 +104,10 @@ class Account(db.Model):
 class AccountQuery(BaseQuery):
     def with_balance(self):
         balance = db.session.query(
-            Entry.account_id.label('account_id'),
-            db.func.sum(db.case([(Entry.currency == Currency.USD, Entry.amount)])).label('usd'),
-            db.func.sum(db.case([(Entry.currency == Currency.RMB, Entry.amount)])).label('rmb'),
-        ).filter_by(active=True).group_by(Entry.account_id).subquery('balance')
+            AccountBalance.account_id.label('account_id'),
+            db.func.sum(db.case([(AccountBalance.currency == Currency.USD, AccountBalance.amount)])).label('usd'),
+            db.func.sum(db.case([(AccountBalance.currency == Currency.RMB, AccountBalance.amount)])).label('rmb'),
+        ).group_by(AccountBalance.account_id).subquery('balance')
         return self.options(
             db.with_expression(Account.balance_usd, db.func.round(db.func.coalesce(balance.c.usd, 0), 2)),
             db.with_expression(Account.balance_rmb, db.func.round(db.func.coalesce(balance.c.rmb, 0), 2)),
@@ -81,11 +115,21 @@ class AccountQuery(BaseQuery):
 
     def order_by_entry_count(self):
         count = db.session.query(
-            Entry.account_id.label('account_id'),
-            db.func.count().label('count'),
-        ).group_by(Entry.account_id).subquery('count')  # TODO recent 3 months
+            AccountBalance.account_id.label('account_id'),
+            db.func.sum(AccountBalance.entry_count).label('count'),
+        ).group_by(AccountBalance.account_id).subquery('count')  # TODO recent 3 months
         return (self.outerjoin(count, Account.id == count.c.account_id)
                 .order_by(count.c.count.desc().nullslast(), Account.id))
 
 
 Account.query_class = AccountQuery
+
+
+def _release_balances(session, transaction):
+    if transaction.parent is None:  # the locks are released with the outermost transaction
+        session.info.pop('locked_balances', None)
+
+
+def _forget_balances(session, previous_transaction):
+    if previous_transaction.nested:  # the rows locked or inserted since the savepoint are released with it
+        session.info.pop('locked_balances', None)
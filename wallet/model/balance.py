@@ -0,0 +1,66 @@
+from click import option
+
+from wallet.core import db
+from wallet.model.entry import Entry
+from wallet.model.enums import Currency
+from wallet.util.plivo import error_notifier
+
+
+class AccountBalance(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), nullable=False)
+    currency = db.Column(db.IntEnum(Currency), nullable=False)
+    amount = db.Column(db.Float, nullable=False, default=0)
+    entry_count = db.Column(db.Integer, nullable=False, default=0)
+    updated = db.Column(db.DateTime, nullable=False, default=db.utcnow, onupdate=db.utcnow)
+    # relationships
+    account = db.relationship('Account', back_populates='balances')
+    # metadata
+    __table_args__ = (
+        db.UniqueConstraint('account_id', 'currency', name='account_balance_account_currency_key'),
+    )
+
+    def __repr__(self):
+        return f'<AccountBalance {self.account.name!r} {self.currency.symbol}{self.amount} ({self.entry_count})>'
+
+    @classmethod
+    def rebuild(cls):
+        cls.query.delete()
+        db.session.add_all(cls(account_id=account_id, currency=currency, amount=amount, entry_count=count)
+                           for (account_id, currency), (amount, count) in cls._scan().items())
+
+    @classmethod
+    def verify(cls):
+        expected = cls._scan()
+        actual = {(b.account_id, b.currency): (b.amount, b.entry_count) for b in cls.query}
+        return {key: (actual.get(key), expected.get(key))
+                for key in actual.keys() | expected.keys()
+                if actual.get(key, (0, 0)) != expected.get(key, (0, 0))}
+
+    @staticmethod
+    def _scan():
+        rows = db.session.query(
+            Entry.account_id,
+            Entry.currency,
+            db.func.sum(db.case([(Entry.active, Entry.amount)], else_=0)),
+            db.func.count(),
+        ).group_by(Entry.account_id, Entry.currency)
+        return {(account_id, currency): (round(amount, 2), count)
+                for account_id, currency, amount, count in rows}
+
+    @classmethod
+    def init_app(cls, app):
+        @app.cli.command()
+        @option('--rebuild', is_flag=True, help='Rebuild from entries before verifying.')
+        @error_notifier
+        def verify_account_balances(rebuild):
+            """ Verify Account Balances """
+            if rebuild:
+                cls.rebuild()
+            mismatches = cls.verify()
+            for (account_id, currency), (actual, expected) in mismatches.items():
+                app.logger.warning(f'account {account_id} {currency.name}: {actual}, expected {expected}')
+            if mismatches:
+                raise ValueError(f'{len(mismatches)} account balances not matched')
+            db.session.commit()
+            app.logger.info('account balances verified')
@@ -1,7 +1,9 @@
+from datetime import date
+
 from flask_sqlalchemy import BaseQuery
 
 from wallet.core import db
-from wallet.model.transaction import Transaction
+from wallet.model.spending import CategorySpending
 
 
 class Category(db.Model):
@@ -28,11 +30,13 @@ class Category(db.Model):
 
 
 class CategoryQuery(BaseQuery):
-    def order_by_transaction_count(self):
+    def order_by_transaction_count(self, months=3):
+        month = date.today().year * 12 + date.today().month - months
+        since = date(month // 12, month % 12 + 1, 1)
         count = db.session.query(
-            Transaction.category_id.label('category_id'),
-            db.func.count().label('count')
-        ).group_by(Transaction.category_id).subquery('count')  # TODO recent 3 months
+            CategorySpending.category_id.label('category_id'),
+            db.func.sum(CategorySpending.count).label('count')
+        ).filter(CategorySpending.month >= since).group_by(CategorySpending.category_id).subquery('count')
         return (self.outerjoin(count, Category.id == count.c.category_id)
                 .order_by(count.c.count.desc().nullslast(), Category.id))
 
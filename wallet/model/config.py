@@ -5,6 +5,7 @@ from flask.json import dumps, loads
 from wallet.core import db
 
 TRANSACTION_TEMPLATES = 'transaction_templates'
+IMPORT_RULES = 'import_rules'
 
 
 class Config(db.Model):
@@ -48,3 +49,7 @@ class Config(db.Model):
     def get_transaction_templates(cls, user):
         config = cls._get(user, TRANSACTION_TEMPLATES)
         return config.val if config else '[]'
+
+    @classmethod
+    def get_import_rules(cls):
+        return [(config.user, rule) for config in cls.query.filter_by(key=IMPORT_RULES) for rule in loads(config.val)]
@@ -1,3 +1,5 @@
+from flask_sqlalchemy import BaseQuery
+
 from wallet.core import db
 from wallet.model.enums import Currency
 from wallet.util.swapsy import cached_exchange_rate as exchange_rate
@@ -20,6 +22,12 @@ class Entry(db.Model):
     transaction = db.relationship('Transaction', back_populates='entries')
     successor = db.relationship('Entry', back_populates='predecessors', remote_side=[id])
     predecessors = db.relationship('Entry', back_populates='successor')
+    # metadata
+    __table_args__ = (
+        db.Index('entry_account_id_created_idx', 'account_id', 'created', postgresql_where=active),
+        db.Index('entry_transaction_id_idx', 'transaction_id'),
+        db.Index('entry_successor_id_idx', 'successor_id'),
+    )
 
     def __repr__(self):
         return (f'<Entry {self.name!r} {self.account.name!r} '
@@ -36,6 +44,7 @@ class Entry(db.Model):
         amount = round(amount, 2)
         entry = cls(account=account, name=name, amount=amount, currency=currency,
                     transaction=transaction, active=(amount != 0), pending=pending)
+        account.adjust_balance(currency, amount, count=1)
         if auto_merge:
             if isinstance(auto_merge, list):
                 cls.merge(entry, *auto_merge)
@@ -55,15 +64,24 @@ class Entry(db.Model):
                                name if name else primary.name,
                                amount, primary.currency)
         for asset in assets:
-            asset.active = False
+            asset._set_amount(asset.amount, active=False)
             asset.successor = successor
         return successor
 
     @classmethod
     def get_list(cls, user):
-        return (cls.query.filter_by(active=True)
-                .join(cls.account).filter_by(user=user)
-                .order_by(cls.created).all())
+        return cls.query.active_of(user).order_by(cls.created).all()
+
+    @classmethod
+    def get_page(cls, user, size, after=None, account_id=None, since=None, until=None):
+        query = cls.query.active_of(user)
+        if account_id:
+            query = query.filter(cls.account_id == account_id)
+        if since:
+            query = query.filter(cls.created >= since)
+        if until:
+            query = query.filter(cls.created < until)
+        return db.keyset_page(query, [cls.created, cls.id], after, size)
 
     def split(self, name, amount):
         assert amount != 0
@@ -71,6 +89,7 @@ class Entry(db.Model):
         return db.save(Entry.create(self.account, name, amount, self.currency))
 
     def modify_amount(self, new_amount):
+        from wallet.model.spending import CategorySpending  # which imports Transaction, then this module
         assert self.active
         if len(self.transaction.entries) == 2:
             other = next(e for e in self.transaction.entries
@@ -80,10 +99,29 @@ class Entry(db.Model):
                          if e != self and e.active and e.currency == self.currency
                          and e.account == self.account.user.default_equity_account)
         if self.account.type.is_debit == other.account.type.is_debit:
-            other.amount -= round(new_amount - self.amount, 2)
+            other._set_amount(other.amount - round(new_amount - self.amount, 2))
         else:
-            other.amount += round(new_amount - self.amount, 2)
-        other.active = (other.amount != 0)
-        self.amount = round(new_amount, 2)
-        self.active = (self.amount != 0)
+            other._set_amount(other.amount + round(new_amount - self.amount, 2))
+        self._set_amount(new_amount)
+        CategorySpending.add(self.transaction, sign=-1)  # the amount, or even the currency, changes with finish
         self.transaction.finish()
+        CategorySpending.add(self.transaction)
+
+    def _set_amount(self, amount, active=True):
+        if self.active:
+            self.account.adjust_balance(self.currency, -self.amount)
+        self.amount = round(amount, 2)
+        self.active = active and (self.amount != 0)
+        if self.active:
+            self.account.adjust_balance(self.currency, self.amount)
+
+
+class EntryQuery(BaseQuery):
+    def of(self, user):
+        return self.join(Entry.account).filter_by(user=user)
+
+    def active_of(self, user):
+        return self.filter_by(active=True).of(user)
+
+
+Entry.query_class = EntryQuery
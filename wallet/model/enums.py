@@ -25,6 +25,10 @@ class Timezone(IntEnum):
     def to_utc(self, dt):
         return _TZ[self].localize(dt).astimezone(utc)
 
+    @property
+    def zone(self):
+        return _TZ[self].zone
+
 
 _TZ = {
     Timezone.US: timezone('America/Los_Angeles'),
@@ -0,0 +1,75 @@
+from datetime import date, datetime
+
+from numpy import array, full, maximum, searchsorted, where
+from sqlalchemy.dialects.postgresql import insert
+
+from wallet.core import db
+from wallet.model.enums import Currency
+from wallet.util.plivo import error_notifier
+from wallet.util.swapsy import cached_exchange_rate, refresh_exchange_rate
+
+
+class ExchangeRate(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False)
+    rate = db.Column(db.Float, nullable=False)  # RMB per USD
+    updated = db.Column(db.DateTime, nullable=False, default=db.utcnow, onupdate=db.utcnow)
+    # metadata
+    __table_args__ = (
+        db.UniqueConstraint('date', name='exchange_rate_date_key'),
+    )
+
+    def __repr__(self):
+        return f'<ExchangeRate {self.date} {self.rate}>'
+
+    @classmethod
+    def record(cls):
+        rate = refresh_exchange_rate()
+        stmt = insert(cls.__table__).values(date=datetime.utcnow().date(), rate=rate, updated=db.utcnow())
+        db.session.execute(stmt.on_conflict_do_update(
+            constraint='exchange_rate_date_key',
+            set_={'rate': stmt.excluded.rate, 'updated': stmt.excluded.updated},
+        ))
+        return rate
+
+    @classmethod
+    def rates_as_of(cls, dates):
+        """ The last recorded rate on or before each date, the earliest one for dates before the history. """
+        dates = array(dates, dtype='datetime64[D]')
+        if not len(dates):
+            return array([], dtype=float)
+        rows = (db.session.query(cls.date, cls.rate)
+                .filter(cls.date <= dates.max().item()).order_by(cls.date).all())
+        if not rows:
+            first = cls.query.order_by(cls.date).first()
+            return full(dates.shape, first.rate if first else cached_exchange_rate())
+        known_dates, known_rates = array([d for d, _ in rows], dtype='datetime64[D]'), array([r for _, r in rows])
+        return known_rates[maximum(searchsorted(known_dates, dates, side='right') - 1, 0)]
+
+    @classmethod
+    def convert(cls, amounts, currencies, to, dates=None):
+        amounts = array(amounts, dtype=float)
+        currencies = array([int(c) for c in currencies])
+        if dates is None:
+            rates = full(amounts.shape, cached_exchange_rate())
+        elif isinstance(dates, date):
+            rates = full(amounts.shape, cls.rates_as_of([dates])[0])
+        else:
+            rates = cls.rates_as_of(dates)
+        if to == Currency.USD:
+            return where(currencies == Currency.RMB, amounts / rates, amounts)
+        return where(currencies == Currency.USD, amounts * rates, amounts)
+
+    @classmethod
+    def value(cls, items, to, as_of=None):
+        """ Values entries, account balances or anything else with amount and currency. """
+        return cls.convert([e.amount for e in items], [e.currency for e in items], to, as_of)
+
+    @classmethod
+    def init_app(cls, app):
+        @app.cli.command()
+        @error_notifier
+        def record_exchange_rate():
+            """ Record Today's Exchange Rate """
+            app.logger.info(f'exchange rate recorded: {cls.record()}')
+            db.session.commit()
@@ -1,8 +1,13 @@
-from collections import namedtuple
-from datetime import datetime
+from collections import defaultdict, namedtuple
+from datetime import date, datetime
+from itertools import groupby
+from operator import itemgetter
 
 from flask import current_app
+from flask.json import dumps, loads
+from numpy import array, concatenate, cumprod, around
 from pytz import timezone
+from sqlalchemy.dialects.postgresql import insert
 
 from wallet.core import db
 from wallet.util.m1 import get_accounts
@@ -10,6 +15,8 @@ from wallet.util.plivo import error_notifier
 from wallet.util.robinhood import get_portfolio
 
 tz = timezone('US/Pacific')
+NetValue = namedtuple('NetValue', 'date value gain rate start')
+M1_UPDATED = 'm1:updated'
 
 
 class M1Portfolio(db.Model):
@@ -80,15 +87,17 @@ class M1Portfolio(db.Model):
         current_app.logger.info(f'm1finance: {m1}')
         today = tz.fromutc(datetime.utcnow()).date()
 
+        names = [name for name, performance in m1.items()
+                 if performance and (performance['startValue']['value'] != 0 or performance['endValue']['value'] != 0)]
+        loaded = cls._load(names, today)
         result = []
 
         # M1
-        for name, performance in m1.items():
-            if not performance or (performance['startValue']['value'] == 0 and performance['endValue']['value'] == 0):
-                continue
+        for name in names:
+            performance = m1[name]
             start_date = tz.fromutc(datetime.fromisoformat(performance['startValue']['date'][:-1])).date()
             assert start_date == today, f'start date not matched {start_date}, expected {today}'
-            inst, last = cls._load(name, today)
+            inst, last = loaded[name]
 
             inst.value = performance['endValue']['value']
             inst.gain = performance['totalGain']
@@ -103,7 +112,7 @@ class M1Portfolio(db.Model):
 
         # Robinhood
         # name, rh = 'Robinhood', get_portfolio()
-        # inst, last = cls._load(name, today)
+        # inst, last = cls._load([name], today)[name]
         # inst.value = round(rh.value, 2)
         # inst.start_value = round(rh.start_value, 2)
         # inst.gain = round(rh.value - rh.start_value, 2)
@@ -116,27 +125,92 @@ class M1Portfolio(db.Model):
 
         for inst, last in result:
             inst.inspect(last, fix_start_value=True)
+        cls._save([inst for inst, _ in result])
+        return [inst.name for inst, _ in result]
 
     @classmethod
-    def _load(cls, name, today):
-        inst = cls.query.filter_by(name=name).order_by(cls.date.desc()).first()
-        if inst and inst.date == today:
-            last = cls.query.filter_by(name=name).order_by(cls.date.desc()).offset(1).first()
-        else:
-            last, inst = inst, cls(name=name, date=today)
-            db.session.add(inst)
-        return inst, last
+    def _load(cls, names, today):
+        ranked = db.session.query(
+            cls.id.label('id'),
+            db.func.row_number().over(partition_by=cls.name, order_by=cls.date.desc()).label('rank'),
+        ).filter(cls.name.in_(names)).subquery('ranked')
+        latest = defaultdict(list)
+        for inst in (cls.query.join(ranked, cls.id == ranked.c.id)
+                     .filter(ranked.c.rank <= 2).order_by(cls.name, cls.date.desc())):
+            latest[inst.name].append(inst)
+        return {name: (cls(name=name, date=today),
+                       next((inst for inst in latest[name] if inst.date != today), None))
+                for name in names}
 
     @classmethod
-    def net_value_series(cls, name, limit):
-        R = namedtuple('R', 'date value gain rate start')
-        items = cls.query.filter_by(name=name).order_by(cls.date.desc())[:limit]
-        series = [R(None, None, None, None, items[0].value)]
-        for e in items:
-            gain = round(series[-1].start / (1 + 100 / e.rate), 2) if e.rate != 0 else 0.0
-            start = round(series[-1].start / (1 + e.rate / 100), 2)
-            series.append(R(e.date, series[-1].start, gain, e.rate, start))
-        return series[:0:-1]
+    def _save(cls, insts):
+        if not insts:
+            return
+        columns = ['value', 'gain', 'rate', 'start_value', 'net_cash_flow',
+                   'capital_gain', 'dividend_gain', 'cost_basis', 'updated']
+        now = db.utcnow()
+        stmt = insert(cls.__table__).values([
+            {'name': inst.name, 'date': inst.date, 'updated': now,
+             **{column: getattr(inst, column) for column in columns[:-1]}}
+            for inst in insts
+        ])
+        db.session.execute(stmt.on_conflict_do_update(
+            constraint='m1_portfolio_name_date_key',
+            set_={column: stmt.excluded[column] for column in columns},
+        ))
+
+    @classmethod
+    def net_value_series(cls, name, limit=None, since=None, until=None):
+        return cls.net_value_series_by_name([name], limit, since, until)[name]
+
+    @classmethod
+    def net_value_series_by_name(cls, names, limit=None, since=None, until=None):
+        if not names:
+            return {}
+        versions = current_app.redis.hmget(M1_UPDATED, names)
+        keys = [f'm1:net-value-series:{name}:{(version or b"").decode()}:{limit}:{since}:{until}'
+                for name, version in zip(names, versions)]
+        result = {name: [NetValue(date.fromisoformat(e[0]), *e[1:]) for e in loads(cached)]
+                  for name, cached in zip(names, current_app.redis.mget(keys)) if cached}
+        missing = [name for name in names if name not in result]
+        if missing:
+            computed = cls._net_value_series(missing, limit, since, until)
+            with current_app.redis.pipeline() as pipe:
+                for name, key in zip(names, keys):
+                    if name in computed:
+                        pipe.set(key, dumps([[e.date.isoformat(), *e[1:]] for e in computed[name]]), ex=3600 * 24)
+                pipe.execute()
+            result.update(computed)
+        return result
+
+    @classmethod
+    def _net_value_series(cls, names, limit, since, until):
+        ranked = db.session.query(
+            cls.name, cls.date, cls.value, cls.rate,
+            db.func.row_number().over(partition_by=cls.name, order_by=cls.date.desc()).label('rank'),
+        ).filter(cls.name.in_(names))
+        if since:
+            ranked = ranked.filter(cls.date >= since)
+        if until:
+            ranked = ranked.filter(cls.date <= until)
+        ranked = ranked.subquery('ranked')
+        rows = db.session.query(ranked.c.name, ranked.c.date, ranked.c.value, ranked.c.rate)
+        if limit:
+            rows = rows.filter(ranked.c.rank <= limit)
+        rows = rows.order_by(ranked.c.name, ranked.c.date.desc()).all()
+
+        result = {name: [] for name in names}
+        for name, group in groupby(rows, key=itemgetter(0)):
+            _, dates, values, rates = zip(*group)
+            rates = array(rates)
+            # walk back from the latest value: each day started at its end value / (1 + rate)
+            starts = values[0] / cumprod(1 + rates / 100)
+            ends = concatenate(([values[0]], starts[:-1]))
+            gains = around(ends - starts, 2)
+            result[name] = [NetValue(*e) for e in zip(dates[::-1], around(ends, 2)[::-1].tolist(),
+                                                       gains[::-1].tolist(), rates[::-1].tolist(),
+                                                       around(starts, 2)[::-1].tolist())]
+        return result
 
     @classmethod
     def init_app(cls, app):
@@ -144,5 +218,8 @@ class M1Portfolio(db.Model):
         @error_notifier
         def update_m1_accounts():
             """ Update M1Finance Accounts """
-            cls.update()
+            names = cls.update()
             db.session.commit()
+            if names:
+                updated = int(datetime.utcnow().timestamp())
+                current_app.redis.hset(M1_UPDATED, mapping={name: updated for name in names})
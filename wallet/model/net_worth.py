@@ -0,0 +1,189 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from click import option
+from numpy import arange, argsort, array, cumsum, datetime64, r_, searchsorted, where, zeros
+
+from wallet.core import db
+from wallet.model.account import Account, AccountType
+from wallet.model.balance import AccountBalance
+from wallet.model.entry import Entry
+from wallet.model.enums import Currency
+from wallet.model.exchange_rate import ExchangeRate
+from wallet.util.plivo import error_notifier
+
+NetWorth = namedtuple('NetWorth', 'date usd rmb total_usd')
+GRANULARITIES = ('day', 'week', 'month')
+
+
+class BalanceHistory(db.Model):
+    """ End-of-day balance of an account in one currency, for the days it changed. """
+    id = db.Column(db.Integer, primary_key=True)
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), nullable=False)
+    currency = db.Column(db.IntEnum(Currency), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    # relationships
+    account = db.relationship('Account')
+    # metadata
+    __table_args__ = (
+        db.UniqueConstraint('account_id', 'currency', 'date', name='balance_history_account_currency_date_key'),
+    )
+
+    def __repr__(self):
+        return f'<BalanceHistory {self.account.name!r} [{self.date}] {self.currency.symbol}{self.amount}>'
+
+    @classmethod
+    def extend(cls, until=None):
+        """ Persists the days after the checkpoint up to `until`, yesterday (UTC) by default. """
+        until = until or datetime.utcnow().date() - timedelta(days=1)
+        checkpoint = db.session.query(db.func.max(cls.date)).scalar()
+        if checkpoint and checkpoint >= until:
+            return 0
+        rows = _accumulate(_changes(checkpoint, until), cls._latest())
+        db.session.bulk_insert_mappings(cls, [
+            {'date': day, 'account_id': account_id, 'currency': currency, 'amount': amount}
+            for day, account_id, currency, amount in rows
+        ])
+        return len(rows)
+
+    @classmethod
+    def rebuild(cls):
+        cls.query.delete()
+        return cls.extend()
+
+    @classmethod
+    def verify(cls):
+        """ Current balances derived from the history, that differ from the account balance table. """
+        checkpoint = db.session.query(db.func.max(cls.date)).scalar()
+        current = cls._latest()
+        for _, account_id, currency, amount in _accumulate(_changes(checkpoint, None), current):
+            current[account_id, currency] = amount
+        expected = {(b.account_id, b.currency): b.amount for b in AccountBalance.query}
+        return {key: (current.get(key), expected.get(key))
+                for key in current.keys() | expected.keys()
+                if current.get(key, 0) != expected.get(key, 0)}
+
+    @classmethod
+    def balances(cls, account_ids, since, until):
+        """ Daily balances from `since` to `until` as (dates, {(account_id, currency): array}). """
+        checkpoint = db.session.query(db.func.max(cls.date)).scalar()
+        initial = cls._latest(account_ids, before=since)
+        persisted = (db.session.query(cls.date, cls.account_id, cls.currency, cls.amount)
+                     .filter(cls.account_id.in_(account_ids), cls.date >= since, cls.date <= until)
+                     .order_by(cls.date).all())
+        tail = []
+        if not checkpoint or checkpoint < until:
+            latest = {**initial, **{(a, c): amount for _, a, c, amount in persisted}}
+            tail = _accumulate(_changes(checkpoint, until, account_ids), latest)
+        for day, account_id, currency, amount in tail:
+            if day < since:
+                initial[account_id, currency] = amount
+        changes = {key: ([since], [amount]) for key, amount in initial.items()}
+        for day, account_id, currency, amount in persisted + [row for row in tail if row[0] >= since]:
+            days, amounts = changes.setdefault((account_id, currency), ([], []))
+            days.append(day)
+            amounts.append(amount)
+
+        dates = arange(datetime64(since, 'D'), datetime64(until, 'D') + 1)
+        result = {}
+        for key, (days, amounts) in changes.items():
+            position = searchsorted(array(days, dtype='datetime64[D]'), dates, side='right') - 1
+            result[key] = where(position >= 0, array(amounts)[position], 0)
+        return dates, result
+
+    @classmethod
+    def net_worth(cls, user, since, until, granularity='day'):
+        if granularity not in GRANULARITIES:
+            raise ValueError(f'granularity must be one of {GRANULARITIES}')
+        signs = {account.id: 1 if account.type == AccountType.ASSET else -1
+                 for account in Account.query.filter_by(user=user)
+                 if account.type != AccountType.EQUITY}
+        dates, balances = cls.balances(list(signs), since, until)
+        totals = {currency: zeros(len(dates)) for currency in Currency}
+        for (account_id, currency), amounts in balances.items():
+            totals[currency] += signs[account_id] * amounts
+
+        if granularity == 'week':
+            ends = (dates + 1 - datetime64('1970-01-05')).astype(int) % 7 == 0  # next day is a Monday
+        elif granularity == 'month':
+            ends = (dates + 1).astype('datetime64[M]') != dates.astype('datetime64[M]')
+        else:
+            ends = dates == dates
+        ends[-1] = True
+        dates, usd, rmb = dates[ends], totals[Currency.USD][ends], totals[Currency.RMB][ends]
+        total_usd = usd + rmb / ExchangeRate.rates_as_of(dates)
+        return [NetWorth(*row) for row in zip(dates.tolist(), usd.round(2).tolist(),
+                                              rmb.round(2).tolist(), total_usd.round(2).tolist())]
+
+    @classmethod
+    def _latest(cls, account_ids=None, before=None):
+        query = db.session.query(cls.account_id, cls.currency, cls.amount)
+        if account_ids is not None:
+            query = query.filter(cls.account_id.in_(account_ids))
+        if before:
+            query = query.filter(cls.date < before)
+        query = query.distinct(cls.account_id, cls.currency).order_by(cls.account_id, cls.currency, cls.date.desc())
+        return {(account_id, currency): amount for account_id, currency, amount in query}
+
+    @classmethod
+    def init_app(cls, app):
+        @app.cli.command()
+        @option('--rebuild', is_flag=True, help='Rebuild the whole history.')
+        @error_notifier
+        def extend_balance_history(rebuild):
+            """ Extend Balance History """
+            count = cls.rebuild() if rebuild else cls.extend()
+            mismatches = cls.verify()
+            if mismatches and not rebuild:
+                app.logger.warning(f'balance history drifted from account balances: {mismatches}, rebuilding')
+                count = cls.rebuild()
+                mismatches = cls.verify()
+            if mismatches:
+                raise ValueError(f'{len(mismatches)} balances not matched in history')
+            db.session.commit()
+            app.logger.info(f'balance history extended by {count} rows')
+
+
+def _changes(after, until, account_ids=None):
+    """ Net balance change per day, account and currency, ordered by day. """
+    created = db.select([
+        db.func.date(Entry.created).label('date'), Entry.account_id, Entry.currency, Entry.amount.label('delta'),
+    ])
+    # an entry is only deactivated by merging into its successor, `updated` moves with later edits, or stays NULL
+    # when the entry was merged before its first flush
+    successor = Entry.__table__.alias('successor')
+    deactivated = db.select([
+        db.func.date(db.func.coalesce(successor.c.created, Entry.updated, Entry.created)).label('date'),
+        Entry.account_id, Entry.currency, (-Entry.amount).label('delta'),
+    ]).select_from(
+        Entry.__table__.outerjoin(successor, Entry.successor_id == successor.c.id)
+    ).where(db.and_(db.not_(Entry.active), Entry.amount != 0))
+    events = db.union_all(created, deactivated).alias('events')
+    query = (db.session.query(events.c.date, events.c.account_id, events.c.currency, db.func.sum(events.c.delta))
+             .group_by(events.c.date, events.c.account_id, events.c.currency))
+    if after:
+        query = query.filter(events.c.date > after)
+    if until:
+        query = query.filter(events.c.date <= until)
+    if account_ids is not None:
+        query = query.filter(events.c.account_id.in_(account_ids))
+    return query.order_by(events.c.date).all()
+
+
+def _accumulate(changes, initial):
+    """ Running balance after each change, starting from the `initial` balance of each account and currency. """
+    if not changes:
+        return []
+    keys = {}
+    index = array([keys.setdefault((account_id, currency), len(keys)) for _, account_id, currency, _ in changes])
+    deltas = array([delta for *_, delta in changes], dtype=float)
+    order = argsort(index, kind='stable')  # grouped by key, still by day within a group
+    sums = cumsum(deltas[order])
+    starts = r_[True, index[order][1:] != index[order][:-1]]
+    offsets = (sums - deltas[order])[starts][cumsum(starts) - 1]
+    base = array([initial.get(key, 0) for key in keys], dtype=float)
+    running = zeros(len(changes))
+    running[order] = (sums - offsets + base[index[order]]).round(2)
+    return [(day, account_id, currency, amount)
+            for (day, account_id, currency, _), amount in zip(changes, running.tolist())]
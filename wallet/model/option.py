@@ -0,0 +1,110 @@
+from datetime import date, datetime, timedelta
+
+from sqlalchemy.dialects.postgresql import insert
+
+from wallet.core import db
+
+INSTRUMENTS_TTL = timedelta(hours=12)
+
+
+class OptionInstrument(db.Model):
+    """ Options listed for a chain and expiry date, reused until the listing is older than the TTL. """
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(128), nullable=False)
+    chain_id = db.Column(db.String(36), nullable=False)
+    type = db.Column(db.String(4), nullable=False)  # call or put
+    expiration_date = db.Column(db.Date, nullable=False)
+    strike_price = db.Column(db.Float, nullable=False)
+    fetched = db.Column(db.DateTime, nullable=False, default=db.utcnow)
+    # metadata
+    __table_args__ = (
+        db.UniqueConstraint('url', name='option_instrument_url_key'),
+        db.Index('option_instrument_chain_id_type_expiration_date_idx', 'chain_id', 'type', 'expiration_date'),
+    )
+
+    def __repr__(self):
+        return f'<OptionInstrument {self.chain_id} {self.expiration_date} {self.strike_price} {self.type}>'
+
+    @classmethod
+    def stale_dates(cls, chain_id, option_type, expiry_dates):
+        """ The expiry dates not listed within the TTL. """
+        fresh = {d.isoformat() for d, in (
+            db.session.query(cls.expiration_date).distinct()
+            .filter(cls.chain_id == chain_id, cls.type == option_type,
+                    cls.expiration_date.in_([date.fromisoformat(d) for d in expiry_dates]),
+                    cls.fetched > datetime.utcnow() - INSTRUMENTS_TTL))}
+        return [d for d in expiry_dates if d not in fresh]
+
+    @classmethod
+    def replace(cls, chain_id, option_type, expiry_dates, options):
+        """ Replaces the listing of the expiry dates by `options` as (expiry date, strike price, url). """
+        if not expiry_dates:
+            return
+        cls.query.filter(cls.chain_id == chain_id, cls.type == option_type,
+                         cls.expiration_date.in_([date.fromisoformat(d) for d in expiry_dates])
+                         ).delete(synchronize_session=False)
+        if not options:
+            return
+        now = db.utcnow()
+        stmt = insert(cls.__table__).values([
+            {'url': url, 'chain_id': chain_id, 'type': option_type, 'expiration_date': date.fromisoformat(expiry),
+             'strike_price': strike_price, 'fetched': now}
+            for expiry, strike_price, url in options
+        ])
+        db.session.execute(stmt.on_conflict_do_update(
+            constraint='option_instrument_url_key',
+            set_={column: stmt.excluded[column] for column in ('chain_id', 'type', 'expiration_date',
+                                                               'strike_price', 'fetched')},
+        ))
+
+    @classmethod
+    def get_list(cls, chain_id, option_type, expiry_dates):
+        return [(expiry.isoformat(), strike_price, url) for expiry, strike_price, url in (
+            db.session.query(cls.expiration_date, cls.strike_price, cls.url)
+            .filter(cls.chain_id == chain_id, cls.type == option_type,
+                    cls.expiration_date.in_([date.fromisoformat(d) for d in expiry_dates])))]
+
+
+class OptionSnapshot(db.Model):
+    """ Append-only history of the sampled market data of options. """
+    id = db.Column(db.Integer, primary_key=True)
+    instrument_url = db.Column(db.String(128), nullable=False)
+    taken = db.Column(db.DateTime, nullable=False)
+    mark_price = db.Column(db.Float, nullable=False)
+    delta = db.Column(db.Float)  # greeks are not available for options expiring today
+    gamma = db.Column(db.Float)
+    theta = db.Column(db.Float)
+    implied_volatility = db.Column(db.Float)
+    # metadata
+    __table_args__ = (
+        db.Index('option_snapshot_instrument_url_taken_idx', 'instrument_url', 'taken'),
+    )
+
+    def __repr__(self):
+        return f'<OptionSnapshot {self.instrument_url} [{self.taken}] {self.mark_price} {self.delta}>'
+
+    @classmethod
+    def record(cls, urls, market_data):
+        """ Snapshots of the options quoted, illiquid ones of no mark price are not recorded. """
+        rows = [(url, data) for url, data in zip(urls, market_data) if data['mark_price'] is not None]
+        if not rows:
+            return
+        taken = db.utcnow()
+        db.session.execute(cls.__table__.insert(), [
+            {'instrument_url': url, 'taken': taken, 'mark_price': float(data['mark_price']),
+             **{field: _float(data.get(field)) for field in ('delta', 'gamma', 'theta', 'implied_volatility')}}
+            for url, data in rows
+        ])
+
+    @classmethod
+    def history(cls, urls, since=None, until=None):
+        query = cls.query.filter(cls.instrument_url.in_(urls))
+        if since:
+            query = query.filter(cls.taken >= since)
+        if until:
+            query = query.filter(cls.taken < until)
+        return query.order_by(cls.instrument_url, cls.taken).all()
+
+
+def _float(value):
+    return float(value) if value is not None else None
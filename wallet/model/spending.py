@@ -0,0 +1,96 @@
+from collections import namedtuple
+from datetime import date
+
+from sqlalchemy.dialects.postgresql import insert
+
+from wallet.core import db
+from wallet.model.enums import Currency, Timezone
+from wallet.model.transaction import Transaction
+from wallet.util.plivo import error_notifier
+
+Spending = namedtuple('Spending', 'category_id month currency amount count')
+GROUP_BYS = ('category', 'month', 'category_month')
+
+
+class CategorySpending(db.Model):
+    """ Monthly rollup of transactions per category and currency. """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
+    currency = db.Column(db.IntEnum(Currency), nullable=False)
+    month = db.Column(db.Date, nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+    # relationships
+    user = db.relationship('User')
+    category = db.relationship('Category')
+    # metadata
+    __table_args__ = (
+        db.UniqueConstraint('category_id', 'currency', 'month', name='category_spending_category_currency_month_key'),
+        db.Index('category_spending_user_id_month_idx', 'user_id', 'month'),
+    )
+
+    def __repr__(self):
+        return f'<CategorySpending {self.category.name!r} [{self.month}] {self.currency.symbol}{self.amount}>'
+
+    @classmethod
+    def add(cls, *txns, sign=1):
+        """ Adds the transactions to the rollup, or takes them out of it with a `sign` of -1. """
+        rows = {}
+        for txn in txns:
+            occurred = txn.occurred
+            key = (txn.category.id, txn.currency, date(occurred.year, occurred.month, 1))
+            amount, count, _ = rows.get(key, (0, 0, None))
+            rows[key] = (round(amount + sign * txn.amount, 2), count + sign, txn.user.id)
+        if not rows:
+            return
+        stmt = insert(cls.__table__).values([
+            {'user_id': user_id, 'category_id': category_id, 'currency': currency, 'month': month,
+             'amount': amount, 'count': count}
+            for (category_id, currency, month), (amount, count, user_id) in rows.items()
+        ])
+        db.session.execute(stmt.on_conflict_do_update(
+            constraint='category_spending_category_currency_month_key',
+            set_={'amount': db.func.round((cls.__table__.c.amount + stmt.excluded.amount).cast(db.Numeric), 2),
+                  'count': cls.__table__.c.count + stmt.excluded.count},
+        ))
+
+    @classmethod
+    def rebuild(cls):
+        cls.query.delete()
+        zone = db.case([(Transaction.occurred_tz == tz, tz.zone) for tz in Timezone])
+        month = db.func.date_trunc('month', db.func.timezone(zone, db.func.timezone('UTC', Transaction.occurred_utc)))
+        select = db.select([
+            Transaction.user_id, Transaction.category_id, Transaction.currency, db.cast(month, db.Date),
+            db.func.round(db.cast(db.func.sum(Transaction.amount), db.Numeric), 2), db.func.count(),
+        ]).group_by(Transaction.user_id, Transaction.category_id, Transaction.currency, month)
+        db.session.execute(cls.__table__.insert().from_select(
+            ['user_id', 'category_id', 'currency', 'month', 'amount', 'count'], select))
+
+    @classmethod
+    def get_list(cls, user, since, until, group_by):
+        if group_by not in GROUP_BYS:
+            raise ValueError(f'group by must be one of {GROUP_BYS}')
+        columns = {
+            'category': ['category_id'],
+            'month': ['month'],
+            'category_month': ['category_id', 'month'],
+        }[group_by]
+        query = (db.session.query(*(getattr(cls, c) for c in columns), cls.currency,
+                                  db.func.sum(cls.amount), db.func.sum(cls.count))
+                 .filter(cls.user_id == user.id, cls.month >= date(since.year, since.month, 1), cls.month <= until)
+                 .group_by(*(getattr(cls, c) for c in columns), cls.currency)
+                 .order_by(*(getattr(cls, c) for c in columns), cls.currency))
+        return [Spending(**{**dict.fromkeys(Spending._fields), **dict(zip(columns, row)),
+                            'currency': row[-3], 'amount': round(row[-2], 2), 'count': row[-1]})
+                for row in query]
+
+    @classmethod
+    def init_app(cls, app):
+        @app.cli.command()
+        @error_notifier
+        def rebuild_category_spending():
+            """ Rebuild Category Spending """
+            cls.rebuild()
+            db.session.commit()
+            app.logger.info(f'category spending rebuilt: {cls.query.count()} rows')
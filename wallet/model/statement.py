@@ -0,0 +1,212 @@
+import re
+from collections import Counter, defaultdict, namedtuple
+from csv import reader
+from datetime import datetime
+from fnmatch import fnmatch
+from io import TextIOWrapper
+from itertools import islice
+
+from click import argument
+from flask import current_app
+from psycopg2.extras import execute_values
+
+from wallet.core import db
+from wallet.model.account import Account, AccountType
+from wallet.model.category import Category
+from wallet.model.config import Config
+from wallet.model.entry import Entry
+from wallet.model.enums import Currency, Timezone
+from wallet.model.spending import CategorySpending
+from wallet.model.transaction import Transaction
+from wallet.util.plivo import error_notifier, send
+
+BATCH_SIZE = 1000
+
+
+class ImportedTransaction(namedtuple('ImportedTransaction',
+                                     'user category name entry_amount currency occurred_utc occurred_tz')):
+    """ Quacks like Transaction for CategorySpending. """
+
+    @property
+    def amount(self):
+        return abs(self.entry_amount)
+
+    @property
+    def occurred(self):
+        return self.occurred_tz.from_utc(self.occurred_utc)
+
+
+class StatementRule:
+    """
+    Maps the rows of a statement file to transactions of one account, configured per user as json:
+    {"file": "WishCash_*.xlsm", "account": 3, "currency": "USD", "timezone": "US", "header_row": 1,
+     "columns": {"time": "Date", "description": "Description", "amount": "Amount", "balance": "Balance"},
+     "date_format": "%m/%d/%Y", "negate": false, "default_category": 9,
+     "categories": [{"match": "uber|lyft", "category": 11}]}
+    """
+
+    def __init__(self, user, rule):
+        accounts = {account.id: account for account in Account.query.filter_by(user=user)}
+        categories = {category.id: category for category in Category.query.filter_by(user=user)}
+        self.user = user
+        self.account = accounts[rule['account']]
+        self.currency = Currency[rule.get('currency', 'USD')]
+        self.timezone = Timezone[rule.get('timezone', 'US')]
+        self.header_row = rule.get('header_row', 1)
+        self.columns = {'time': 'Date', 'description': 'Description', 'amount': 'Amount',
+                        **rule.get('columns', {})}
+        self.date_format = rule.get('date_format', '%m/%d/%Y')
+        self.negate = rule.get('negate', False)
+        self.default_category = categories[rule['default_category']]
+        self.categories = [(re.compile(c['match'], re.IGNORECASE), categories[c['category']])
+                           for c in rule.get('categories', [])]
+        self.balance = None
+
+    def parse(self, rows):
+        """ Transactions of the rows in date order, a statement listed newest first is reversed. """
+        parsed = []
+        for row in rows:
+            amount = _parse_amount(row.get(self.columns['amount']))
+            if not amount:
+                continue
+            amount = round(-amount if self.negate else amount, 2)
+            description = str(row.get(self.columns['description']) or '').strip()
+            time = row[self.columns['time']]
+            if not isinstance(time, datetime):
+                time = datetime.strptime(str(time).strip(), self.date_format)
+            category = next((c for pattern, c in self.categories if pattern.search(description)),
+                            self.default_category)
+            parsed.append((ImportedTransaction(self.user, category, description[:128] or category.name,
+                                               amount, self.currency,
+                                               self.timezone.to_utc(time).replace(tzinfo=None), self.timezone), row))
+        if len(parsed) > 1 and parsed[0][0].occurred_utc > parsed[-1][0].occurred_utc:
+            parsed.reverse()
+        for txn, row in parsed:
+            self._check_balance(row, txn.entry_amount)
+        return [txn for txn, _ in parsed]
+
+    def _check_balance(self, row, amount):
+        if 'balance' not in self.columns:
+            return
+        balance = _parse_amount(row.get(self.columns['balance']))
+        if self.balance is not None and round(self.balance + amount - balance, 2) != 0:
+            raise ValueError(f'balance not matched {balance}, expected {round(self.balance + amount, 2)}: {row}')
+        self.balance = balance
+
+    def skip_imported(self, txns):
+        """
+        The transactions not imported into the account yet, matched by time, amount and description. Identical rows
+        of a statement are counted, so they are only skipped as many times as they were imported. Entries merged
+        since are still imported ones.
+        """
+        if not txns:
+            return txns
+        imported = Counter(db.session.query(Transaction.occurred_utc, Entry.amount, Transaction.name)
+                           .join(Entry.transaction)
+                           .filter(Entry.account_id == self.account.id,
+                                   db.or_(Entry.active, Entry.successor_id.isnot(None)),
+                                   Transaction.occurred_utc >= min(t.occurred_utc for t in txns),
+                                   Transaction.occurred_utc <= max(t.occurred_utc for t in txns)))
+        result = []
+        for t in txns:
+            key = (t.occurred_utc, t.entry_amount, t.name)
+            if imported[key]:
+                imported[key] -= 1
+            else:
+                result.append(t)
+        return result
+
+
+def import_statement(rule, file_name, stream):
+    parsed = rule.parse(read_rows(file_name, stream, rule.header_row))  # whole, to tell the order of the rows
+    txns = rule.skip_imported(parsed)
+    for i in range(0, len(txns), BATCH_SIZE):
+        _insert(rule.account, txns[i:i + BATCH_SIZE])
+    current_app.logger.info(f'{len(txns)} transactions imported from {file_name} into {rule.account}, '
+                            f'{len(parsed) - len(txns)} imported before')
+    return len(txns)
+
+
+def read_rows(file_name, stream, header_row=1):
+    if file_name.lower().endswith(('.xlsx', '.xlsm')):
+        from openpyxl import load_workbook
+        rows = load_workbook(stream, read_only=True, data_only=True).active.iter_rows(values_only=True)
+    else:
+        rows = reader(TextIOWrapper(stream, encoding='utf-8-sig'))
+    header = [str(column or '').strip() for column in next(islice(rows, header_row - 1, None))]
+    for row in rows:
+        yield dict(zip(header, row))
+
+
+def rules_for(file_name):
+    return [StatementRule(user, rule) for user, rule in Config.get_import_rules() if fnmatch(file_name, rule['file'])]
+
+
+@error_notifier
+def import_drive_file(file_id, file_name):
+    from wallet.util.google_drive import download_file
+    rules = rules_for(file_name)
+    if not rules:
+        return 0
+    count = import_statement(rules[0], file_name, download_file(file_id))
+    db.session.commit()
+    send(f'导入完成\n{file_name}\n{count}笔交易')
+    return count
+
+
+def init_app(app):
+    @app.cli.command()
+    @argument('path')
+    @error_notifier
+    def import_statement_file(path):
+        """ Import Statement File """
+        file_name = path.rsplit('/', 1)[-1]
+        rules = rules_for(file_name)
+        if not rules:
+            raise ValueError(f'no import rule matched {file_name}')
+        with open(path, 'rb') as stream:
+            import_statement(rules[0], file_name, stream)
+        db.session.commit()
+
+
+def _insert(account, txns):
+    if not txns:
+        return
+    equity = account.user.default_equity_account
+    sign = 1 if account.type == AccountType.ASSET else -1
+    session = db.session
+    ids = [i for i, in session.execute(
+        "SELECT nextval('transaction_id_seq') FROM generate_series(1, :n)", {'n': len(txns)})]
+    now = db.utcnow()
+    cursor = session.connection().connection.cursor()
+    execute_values(cursor, '''
+        INSERT INTO "transaction" (id, user_id, name, category_id, amount, currency, occurred_utc, occurred_tz)
+        VALUES %s
+    ''', [(i, t.user.id, t.name, t.category.id, t.amount, int(t.currency), t.occurred_utc, int(t.occurred_tz))
+          for i, t in zip(ids, txns)], page_size=BATCH_SIZE)
+    # the other side of each statement row goes to the default equity account, the same as Transaction.finish
+    execute_values(cursor, '''
+        INSERT INTO entry (account_id, active, pending, transaction_id, name, amount, currency, created)
+        VALUES %s
+    ''', [(a.id, True, False, i, t.name, amount, int(t.currency), now)
+          for i, t in zip(ids, txns)
+          for a, amount in ((account, t.entry_amount), (equity, sign * t.entry_amount))],
+        page_size=BATCH_SIZE)
+
+    totals = defaultdict(lambda: [0, 0])
+    for t in txns:
+        totals[t.currency][0] += t.entry_amount
+        totals[t.currency][1] += 1
+    for currency, (amount, count) in totals.items():
+        account.adjust_balance(currency, amount, count)
+        equity.adjust_balance(currency, sign * amount, count)
+    CategorySpending.add(*txns)
+
+
+def _parse_amount(value):
+    if value is None or isinstance(value, (int, float)):
+        return value
+    text = str(value).strip().replace(',', '').replace('$', '').replace('¥', '')
+    if text.startswith('(') and text.endswith(')'):
+        text = '-' + text[1:-1]
+    return float(text) if text else None
@@ -0,0 +1,44 @@
+from datetime import datetime
+
+from pytest import raises
+from sqlalchemy.exc import OperationalError
+
+from wallet.core import db
+from wallet.model.account import Account, AccountType
+from wallet.model.balance import AccountBalance
+from wallet.model.category import Category
+from wallet.model.enums import Currency, Timezone
+from wallet.model.transaction import Transaction
+
+
+def test_balance_verification(context):
+    assert context
+    assert not AccountBalance.verify()
+
+
+def test_balance_maintained_incrementally(user):
+    account = Account.create(user, 'test', AccountType.ASSET)
+    category = Category.create(user, 'test')
+    txn = Transaction.create(user, 'test', category, datetime.utcnow(), Timezone.US)
+    txn.add_entry(account, 6.07, Currency.USD)
+    txn.add_entry(account, 7.58, Currency.USD)
+    txn.finish()
+    entry = txn.entries[0]
+    entry.modify_amount(8.01)
+    db.session.flush()
+    assert account.adjust_balance(Currency.USD, 0).amount == 15.59
+    assert not AccountBalance.verify()
+
+
+def test_balance_row_locked(user):
+    account = Account.create(user, 'test', AccountType.ASSET)
+    db.session.flush()
+    balance = account.adjust_balance(Currency.RMB, 1.5, count=1)
+    assert account.adjust_balance(Currency.RMB, 2, count=1) is balance and balance.amount == 3.5
+    db.session.flush()
+    assert AccountBalance.query.filter_by(account=account).count() == 1
+
+    existing = user.default_equity_account.adjust_balance(Currency.USD, 0)
+    with db.engine.connect() as other:  # another writer waits for the row until this transaction ends
+        with raises(OperationalError):
+            other.execute('SELECT * FROM account_balance WHERE id = %s FOR UPDATE NOWAIT', existing.id)
@@ -1,5 +1,40 @@
+from datetime import date, datetime, timedelta
+
+from wallet.core import db
+from wallet.model.account import Account, AccountType
 from wallet.model.category import Category
+from wallet.model.enums import Currency, Timezone
+from wallet.model.spending import CategorySpending
+from wallet.model.transaction import Transaction
 
 
 def test_category_list(user):
     assert Category.get_list(user)
+
+
+def test_spending_rollup(user):
+    CategorySpending.rebuild()
+    category = Category.query.filter_by(user=user).first()
+    txns = Transaction.query.filter_by(category=category).all()
+    rows = CategorySpending.get_list(user, date(1970, 1, 1), date.today() + timedelta(days=31), 'category')
+    assert sum(row.count for row in rows if row.category_id == category.id) == len(txns)
+    for currency in Currency:
+        expected = round(sum(t.amount for t in txns if t.currency == currency), 2)
+        actual = sum(row.amount for row in rows if row.category_id == category.id and row.currency == currency)
+        assert round(actual - expected, 2) == 0
+
+
+def test_spending_after_modify(user):
+    CategorySpending.rebuild()
+    category = Category.query.filter_by(user=user).first()
+    account = Account.query.filter_by(user=user, type=AccountType.ASSET).first()
+    txn = Transaction.create(user, 'test', category, datetime.utcnow(), Timezone.US)
+    txn.add_entry(account, -6.07, Currency.USD)
+    txn.finish()
+    CategorySpending.add(txn)
+    txn.entries[0].modify_amount(-8.01)
+    since, until = date(1970, 1, 1), date.today() + timedelta(days=31)
+    rows = CategorySpending.get_list(user, since, until, 'category_month')
+    db.session.flush()
+    CategorySpending.rebuild()
+    assert CategorySpending.get_list(user, since, until, 'category_month') == rows
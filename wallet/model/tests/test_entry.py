@@ -24,3 +24,11 @@ def test_formula(user):
 
     assert round(sum(amount(entry) for entry in entries(Currency.USD)), 2) == 0
     assert round(sum(amount(entry) for entry in entries(Currency.RMB)), 2) == 0
+
+
+def test_page(user):
+    entries = Entry.query.active_of(user).order_by(Entry.created.desc(), Entry.id.desc()).all()
+    page, has_next = Entry.get_page(user, 3)
+    assert page == entries[:3] and has_next == (len(entries) > 3)
+    page, _ = Entry.get_page(user, 3, after=(page[-1].created, page[-1].id))
+    assert page == entries[3:6]
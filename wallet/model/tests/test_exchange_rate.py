@@ -0,0 +1,21 @@
+from datetime import date
+
+from wallet.core import db
+from wallet.model.enums import Currency
+from wallet.model.exchange_rate import ExchangeRate
+
+
+def test_convert_as_of(context):
+    assert context
+    ExchangeRate.query.delete()
+    db.session.add_all([ExchangeRate(date=date(2020, 1, 1), rate=7.0),
+                        ExchangeRate(date=date(2020, 1, 3), rate=6.5)])
+    db.session.flush()
+    dates = [date(2019, 12, 1), date(2020, 1, 1), date(2020, 1, 2), date(2020, 1, 3), date(2021, 1, 1)]
+    assert list(ExchangeRate.rates_as_of(dates)) == [7.0, 7.0, 7.0, 6.5, 6.5]
+    assert not len(ExchangeRate.rates_as_of([]))
+    usd = ExchangeRate.convert([70, 65, 10], [Currency.RMB, Currency.RMB, Currency.USD], Currency.USD,
+                               [date(2020, 1, 2), date(2020, 1, 4), date(2020, 1, 4)])
+    assert list(usd) == [10, 10, 10]
+    rmb = ExchangeRate.convert([10, 10], [Currency.USD, Currency.RMB], Currency.RMB, date(2020, 1, 2))
+    assert list(rmb) == [70, 10]
@@ -0,0 +1,71 @@
+from pytest import fixture
+
+from wallet.core import db
+from wallet.model.category import Category
+from wallet.model.entry import Entry
+from wallet.model.m1 import M1Portfolio
+from wallet.model.transaction import Transaction
+
+
+@fixture
+def ledger(user):
+    db.session.execute('''
+        WITH a AS (SELECT array_agg(id) AS ids FROM account)
+        INSERT INTO entry (account_id, active, pending, name, amount, currency, created)
+        SELECT a.ids[1 + g % array_length(a.ids, 1)], g % 100 = 0, false, 'seed', 1, 1 + g % 2,
+               now() - g * interval '1 minute'
+        FROM a, generate_series(1, 1000000) AS g
+    ''')
+    db.session.execute('''
+        WITH c AS (SELECT array_agg(id) AS ids FROM category)
+        INSERT INTO transaction (user_id, name, category_id, amount, currency, occurred_utc, occurred_tz)
+        SELECT :user_id, 'seed', c.ids[1 + g % array_length(c.ids, 1)], 1, 1, now() - g * interval '1 minute', 1
+        FROM c, generate_series(1, 200000) AS g
+    ''', {'user_id': user.id})
+    db.session.execute('''
+        INSERT INTO m1_portfolio (name, date, value, gain, rate, start_value, net_cash_flow,
+                                  capital_gain, dividend_gain, updated)
+        SELECT 'seed' || n, current_date - d, 1, 0, 0, 1, 0, 0, 0, now()
+        FROM generate_series(1, 100) AS n, generate_series(1, 2000) AS d
+    ''')
+    for table in ('entry', 'transaction', 'm1_portfolio'):
+        db.session.execute(f'ANALYZE "{table}"')
+    return user
+
+
+def test_entry_list_uses_index(ledger):
+    assert 'entry_account_id_created_idx' in _indexes(Entry.query.active_of(ledger).order_by(Entry.created))
+
+
+def test_active_entries_uses_index(ledger):
+    account = ledger.default_equity_account
+    assert 'entry_account_id_created_idx' in _indexes(account._entries.filter_by(active=True))
+
+
+def test_transaction_entries_uses_index(ledger):
+    assert 'entry_transaction_id_idx' in _indexes(Entry.query.filter_by(transaction_id=1))
+
+
+def test_category_transactions_uses_index(ledger):
+    category = Category.query.filter_by(user=ledger).first()
+    query = (Transaction.query.filter_by(category=category)
+             .order_by(Transaction.occurred_utc.desc()).limit(20))
+    assert 'transaction_category_id_occurred_utc_idx' in _indexes(query)
+
+
+def test_m1_portfolio_load_uses_index(ledger):
+    assert ledger
+    query = M1Portfolio.query.filter_by(name='seed1').order_by(M1Portfolio.date.desc()).limit(2)
+    assert 'm1_portfolio_name_date_key' in _indexes(query)
+
+
+def _indexes(query):
+    sql = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    plan = db.session.execute(f'EXPLAIN (FORMAT JSON) {sql}').scalar()[0]['Plan']
+
+    def walk(node):
+        yield node.get('Index Name')
+        for child in node.get('Plans', []):
+            yield from walk(child)
+
+    return set(walk(plan))
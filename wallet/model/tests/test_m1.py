@@ -1,3 +1,6 @@
+from datetime import date
+
+from wallet.core import db
 from wallet.model.m1 import M1Portfolio
 
 
@@ -14,3 +17,25 @@ def test_portfolio_inspection(context):
 
     test('Individual')
     test('Roth IRA')
+
+
+def test_portfolio_bulk_load(context):
+    assert context
+    today = date.today()
+    names = [name for name, in db.session.query(M1Portfolio.name).distinct()]
+    for name, (inst, last) in M1Portfolio._load(names, today).items():
+        expected = (M1Portfolio.query.filter_by(name=name).filter(M1Portfolio.date != today)
+                    .order_by(M1Portfolio.date.desc()).first())
+        assert inst.name == name and inst.date == today
+        assert last is expected
+
+
+def test_net_value_series(context):
+    assert context
+    names = [name for name, in db.session.query(M1Portfolio.name).distinct()]
+    for name, series in M1Portfolio._net_value_series(names, 30, None, None).items():
+        latest = M1Portfolio.query.filter_by(name=name).order_by(M1Portfolio.date.desc()).first()
+        assert len(series) == min(30, M1Portfolio.query.filter_by(name=name).count())
+        assert series[-1].date == latest.date and series[-1].value == round(latest.value, 2)
+        assert all(series[i].date < series[i + 1].date for i in range(len(series) - 1))
+        assert all(series[i].value == series[i + 1].start for i in range(len(series) - 1))
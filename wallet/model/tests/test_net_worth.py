@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+
+from wallet.core import db
+from wallet.model.account import Account, AccountType
+from wallet.model.entry import Entry
+from wallet.model.enums import Currency
+from wallet.model.net_worth import BalanceHistory
+
+
+def test_history_matches_balances(context):
+    assert context
+    BalanceHistory.rebuild()
+    assert not BalanceHistory.verify()
+
+
+def test_net_worth(user):
+    BalanceHistory.rebuild()
+    today = datetime.utcnow().date()
+    series = BalanceHistory.net_worth(user, today - timedelta(days=90), today, 'week')
+    assert series[-1].date == today
+    assert all(series[i].date < series[i + 1].date for i in range(len(series) - 1))
+    accounts = [a for a in Account.get_list(user) if a.type != AccountType.EQUITY]
+    sign = {AccountType.ASSET: 1, AccountType.LIABILITY: -1}
+    for currency, balance in ((Currency.USD, 'balance_usd'), (Currency.RMB, 'balance_rmb')):
+        expected = round(sum(sign[a.type] * getattr(a, balance) for a in accounts), 2)
+        assert round(getattr(series[-1], currency.name.lower()) - expected, 2) == 0
+
+
+def test_history_after_merges(user):
+    BalanceHistory.rebuild()
+    today = datetime.utcnow().date()
+    trunk = Entry.query.filter_by(account=user.default_equity_account, active=True).first()
+    branch = trunk.split('test', 1.02)
+    Entry.merge(branch, trunk.successor)
+    db.session.flush()
+    assert BalanceHistory.extend(until=today)
+    assert not BalanceHistory.verify()
+    incremental = _rows()
+    BalanceHistory.query.delete()
+    BalanceHistory.extend(until=today)
+    assert _rows() == incremental
+
+    since = today - timedelta(days=7)
+    _, balances = BalanceHistory.balances([trunk.account_id], since, today)
+    expected = next(b.amount for b in trunk.account.balances if b.currency == trunk.currency)
+    assert round(balances[trunk.account_id, trunk.currency][-1] - expected, 2) == 0
+
+
+def _rows():
+    return sorted((h.account_id, h.currency, h.date, h.amount) for h in BalanceHistory.query)
@@ -0,0 +1,31 @@
+from datetime import date, timedelta
+
+from wallet.model.option import OptionInstrument, OptionSnapshot
+
+CHAIN = 'test-chain'
+
+
+def test_instrument_listing(context):
+    assert context
+    expiry = (date.today() + timedelta(days=7)).isoformat()
+    assert OptionInstrument.stale_dates(CHAIN, 'put', [expiry]) == [expiry]
+    options = [(expiry, 100., 'http://options/test-100/'), (expiry, 105., 'http://options/test-105/')]
+    OptionInstrument.replace(CHAIN, 'put', [expiry], options)
+    assert OptionInstrument.stale_dates(CHAIN, 'put', [expiry]) == []
+    assert OptionInstrument.stale_dates(CHAIN, 'call', [expiry]) == [expiry]
+    assert sorted(OptionInstrument.get_list(CHAIN, 'put', [expiry])) == options
+    OptionInstrument.replace(CHAIN, 'put', [expiry], options[1:])
+    assert OptionInstrument.get_list(CHAIN, 'put', [expiry]) == options[1:]
+
+
+def test_snapshot_history(context):
+    assert context
+    urls = ['http://options/test-100/', 'http://options/test-105/']
+    for _ in range(2):
+        OptionSnapshot.record(urls, [{'mark_price': '1.00', 'delta': '-0.30', 'gamma': '0.01', 'theta': '-0.02'},
+                                     {'mark_price': '2.00', 'delta': None, 'gamma': None, 'theta': None}])
+    history = OptionSnapshot.history(urls)
+    assert [s.instrument_url for s in history] == [urls[0], urls[0], urls[1], urls[1]]
+    assert history[0].delta == -.3 and history[-1].delta is None
+    OptionSnapshot.record(urls, [{'mark_price': None, 'delta': None, 'gamma': None, 'theta': None}] * 2)
+    assert len(OptionSnapshot.history(urls)) == 4
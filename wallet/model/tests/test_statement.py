@@ -0,0 +1,56 @@
+from io import BytesIO
+
+from wallet.model.account import Account, AccountType
+from wallet.model.balance import AccountBalance
+from wallet.model.category import Category
+from wallet.model.entry import Entry
+from wallet.model.statement import StatementRule, import_statement
+from wallet.model.transaction import Transaction
+
+STATEMENT = b'''Date,Description,Amount,Balance
+10/01/2026,Opening,100.00,100.00
+10/02/2026,Uber trip,-12.50,87.50
+10/03/2026,Grocery,"(20.00)",67.50
+10/04/2026,Pending,,67.50
+'''
+
+
+def _rule(user):
+    account = Account.query.filter_by(user=user, type=AccountType.ASSET).first()
+    categories = Category.query.filter_by(user=user).limit(2).all()
+    return StatementRule(user, {
+        'file': '*.csv', 'account': account.id, 'default_category': categories[0].id,
+        'columns': {'balance': 'Balance'}, 'categories': [{'match': 'uber', 'category': categories[-1].id}],
+    }), categories
+
+
+def test_import_statement(user):
+    rule, categories = _rule(user)
+    before = Transaction.query.filter_by(user=user).count()
+    assert import_statement(rule, 'statement.csv', BytesIO(STATEMENT)) == 3
+    assert Transaction.query.filter_by(user=user).count() == before + 3
+    assert Transaction.query.filter_by(user=user, name='Uber trip').first().category == categories[-1]
+    assert not AccountBalance.verify()
+
+
+def test_newest_first_reimported(user):
+    header, *rows = STATEMENT.splitlines(keepends=True)
+    newest_first = header + b''.join(reversed(rows))
+    before = Transaction.query.filter_by(user=user).count()
+    assert import_statement(_rule(user)[0], 'statement.csv', BytesIO(newest_first)) == 3
+    assert import_statement(_rule(user)[0], 'statement.csv', BytesIO(STATEMENT)) == 0
+    assert Transaction.query.filter_by(user=user).count() == before + 3
+
+    twice = STATEMENT + b'10/04/2026,Uber trip,-12.50,55.00\n10/04/2026,Uber trip,-12.50,42.50\n'
+    assert import_statement(_rule(user)[0], 'statement.csv', BytesIO(twice)) == 2
+    assert not AccountBalance.verify()
+
+
+def test_merged_reimported(user):
+    statement = b'Date,Description,Amount,Balance\n11/01/2026,Merged coffee,-4.50,95.50\n11/02/2026,Merged coffee,-5.50,90.00\n'
+    rule = _rule(user)[0]
+    assert import_statement(rule, 'statement.csv', BytesIO(statement)) == 2
+    entries = Entry.query.filter_by(account=rule.account, name='Merged coffee', active=True).all()
+    Entry.merge(*entries)
+    assert import_statement(_rule(user)[0], 'statement.csv', BytesIO(statement)) == 0
+    assert not AccountBalance.verify()
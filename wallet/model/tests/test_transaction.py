@@ -51,3 +51,12 @@ def test_create_transaction_with_erroneous_currency_exchange(user):
     txn.add_entry(account, 8 * rate, Currency.RMB)
     with raises(AssertionError):
         txn.finish()
+
+
+def test_page(user):
+    txns = (Transaction.query.filter_by(user=user)
+            .order_by(Transaction.occurred_utc.desc(), Transaction.id.desc()).all())
+    page, has_next = Transaction.get_page(user, 3)
+    assert page == txns[:3] and has_next == (len(txns) > 3)
+    page, _ = Transaction.get_page(user, 3, after=(page[-1].occurred_utc, page[-1].id))
+    assert page == txns[3:6]
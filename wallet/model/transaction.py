@@ -21,6 +21,11 @@ class Transaction(db.Model):
     user = db.relationship('User')
     category = db.relationship('Category')
     entries = db.relationship('Entry', back_populates='transaction')
+    # metadata
+    __table_args__ = (
+        db.Index('transaction_category_id_occurred_utc_idx', 'category_id', 'occurred_utc'),
+        db.Index('transaction_user_id_occurred_utc_id_idx', 'user_id', 'occurred_utc', 'id'),
+    )
 
     def __repr__(self):
         return (f'<Transaction {self.name!r} {self.category.name!r} '
@@ -36,6 +41,19 @@ class Transaction(db.Model):
         return db.save(cls(user=user, name=name, category=category,
                            occurred_utc=occurred_utc, occurred_tz=occurred_tz))
 
+    @classmethod
+    def get_page(cls, user, size, after=None, category_id=None, account_id=None, since=None, until=None):
+        query = cls.query.filter_by(user=user)
+        if category_id:
+            query = query.filter(cls.category_id == category_id)
+        if account_id:
+            query = query.filter(cls.entries.any(account_id=account_id))
+        if since:
+            query = query.filter(cls.occurred_utc >= since)
+        if until:
+            query = query.filter(cls.occurred_utc < until)
+        return db.keyset_page(query, [cls.occurred_utc, cls.id], after, size)
+
     def add_entry(self, account, amount, currency, name=None, pending=False, auto_merge=None):
         assert amount != 0
         if not name:
@@ -62,6 +80,7 @@ class Transaction(db.Model):
             assert not auto_merge
             self.add_entry(self.user.default_equity_account, amounts[Currency.RMB], Currency.RMB, name)
             self.add_entry(self.user.default_equity_account, amounts[Currency.USD], Currency.USD, name)
-        entry = max(self.entries, key=lambda e: abs(e.usd_amount))
+        rate = exchange_rate()
+        entry = max(self.entries, key=lambda e: abs(e.amount if e.currency == Currency.USD else e.amount / rate))
         self.amount = abs(entry.amount)
         self.currency = entry.currency
@@ -1,27 +1,37 @@
 from collections import defaultdict
 from datetime import date, timedelta
 from functools import reduce
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
 from operator import concat
 
 import seaborn
-from numpy import ones
-from pandas import DataFrame
-from pandas_datareader import DataReader
+from numpy import arange, eye, finfo, isfinite, ndarray, outer, sqrt
+from numpy.linalg import norm
+from pandas import DataFrame, Series
 
+from wallet.util.backtest import rebalance, rebalance_grid
 from wallet.util.m1 import get_hedge_fund_replication_securities, screen_funds, screen_securities
+from wallet.util.portfolio import frontier_portfolio, long_only_portfolio
+from wallet.util.price_store import PriceStore
+
+DRIFT_TOLERANCE = 1e-10
+DRIFT_CHECK_EVERY = 10
 
 seaborn.set(rc={'figure.figsize': (15, 5)})
 
 
 class Analysis:
-    def __init__(self, symbols, data_points, period, risk_free_rate_per_year=2):
+    def __init__(self, symbols, data_points, period, risk_free_rate_per_year=2, store=None):
+        store = store or PriceStore()
         data_points += period
         start = date.today() - timedelta(days=data_points * 1.5)
-        start = DataReader('SPY', 'yahoo', start).index[-data_points]
-        self.data = DataReader(symbols, 'yahoo', start)['Adj Close']
+        start = store.load(['SPY'], start).index[-data_points]
+        self.data = store.load(symbols, start)
         self.period = period
         self.origin_data = None
         self.risk_free_rate_per_day = risk_free_rate_per_year / 252
+        self.solved = {}  # {(symbols, first day, last day, period, risk free rate, params): optimize result}
 
     def __str__(self):
         return f'from {self.data.index[0].date()} to {self.data.index[-1].date()} - {len(self.data.columns)} symbols'
@@ -46,7 +56,11 @@ class Analysis:
         return stat
 
     def graph(self, portfolio=None, drop_components=False, truncate=0,
-              rebalance_interval=15, rebalance_threshold=3):
+              rebalance_interval=15, rebalance_threshold=3, rebalance_cost=0.):
+        """
+        Plots the prices scaled to 100 at the start, with the portfolio held and, if long only, rebalanced at
+        least `rebalance_interval` days apart once `rebalance_threshold` percent of its value is to be traded.
+        """
         if portfolio:
             self.setup_mask(portfolio)
             if all(w > 0 for w in portfolio.values()):
@@ -60,20 +74,14 @@ class Analysis:
             if any(w < 0 for w in portfolio.values()):
                 data['Portfolio'] += 100 * (1 - sum(portfolio.values()))
             elif rebalance_interval > 0:
-                data['Portfolio-RB'] = data['Portfolio'].copy()
-                last_rebalance, shares = 1 - rebalance_interval, dict(portfolio)
-                for i in range(1, len(self.data.index)):
-                    idx = self.data.index[i]
-                    data['Portfolio-RB'][idx] = sum(data[st][idx] * sh for st, sh in shares.items())
-                    if i - last_rebalance < rebalance_interval:
-                        continue
-                    new_shares = {st: data['Portfolio-RB'][idx] * sh / data[st][idx] for st, sh in portfolio.items()}
-                    delta = sum(abs(sh - shares[st]) for st, sh in new_shares.items()) * 100 / 2
-                    if delta >= rebalance_threshold:
-                        print(f'{idx.date()} rebalance: '
-                              f'buy {",".join([st for st, sh in new_shares.items() if sh > shares[st]])}, '
-                              f'sell {",".join([st for st, sh in new_shares.items() if sh < shares[st]])}')
-                        last_rebalance, shares = i, new_shares
+                symbols = list(portfolio)
+                result = rebalance(self.data[symbols].values, [portfolio[st] for st in symbols],
+                                   rebalance_interval, rebalance_threshold, rebalance_cost)
+                data['Portfolio-RB'] = Series(result.equity, index=self.data.index)
+                for day, trade in zip(result.days, result.trades):
+                    print(f'{self.data.index[day].date()} rebalance: '
+                          f'buy {",".join([st for st, sh in zip(symbols, trade) if sh > 0])}, '
+                          f'sell {",".join([st for st, sh in zip(symbols, trade) if sh < 0])}')
 
             if drop_components:
                 if isinstance(drop_components, list):
@@ -86,13 +94,36 @@ class Analysis:
         seaborn.lineplot(data=frame, dashes=False)
         return _moving_average_statistics(frame, self.period, self.risk_free_rate_per_day)
 
-    def optimize(self, min_percent=.2, max_count=5, sharpe=True, allow_short=False):
+    def compare_rebalances(self, portfolio, intervals=(5, 15, 30, 60), thresholds=(1, 3, 5, 10), cost=0., cash=0.):
+        symbols = list(portfolio)
+        total = sum(portfolio.values())
+        results = rebalance_grid(self.data[symbols].values, [portfolio[st] / total for st in symbols],
+                                 intervals, thresholds, cost=cost, cash=cash,
+                                 cash_rate=self.risk_free_rate_per_day / 100)
+        names = {key: f'{key[0]}d/{key[1]}%' for key in results}
+        frame = DataFrame({names[key]: r.equity for key, r in results.items()}, index=self.data.index)
+        stat = _moving_average_statistics(frame, self.period, self.risk_free_rate_per_day)
+        stat['trades'] = Series({names[key]: len(r.days) for key, r in results.items()})
+        stat['costs'] = Series({names[key]: round(r.costs, 2) for key, r in results.items()})
+        return stat
+
+    def optimize(self, min_percent=.2, max_count=5, sharpe=True, allow_short=False, long_only=False):
+        if allow_short and long_only:
+            raise ValueError('long only portfolios do not allow short')
+        key = (frozenset(self.data.columns), self.data.index[0], self.data.index[-1], self.period,
+               self.risk_free_rate_per_day, min_percent, max_count, sharpe, allow_short, long_only)
+        if key not in self.solved:
+            self.solved[key] = self._solve(min_percent, max_count, sharpe, allow_short, long_only)
+        return self.solved[key]
+
+    def _solve(self, min_percent, max_count, sharpe, allow_short, long_only):
         data = self.data.rolling(self.period).mean().pct_change() * 100
         corr = data.corr()
         candidates = set(self.data.columns)
         similarity = defaultdict(set)
+        covariance = _Covariance(data)
         while len(candidates) > 1:
-            ratio, shrp = _optimize(data, self.risk_free_rate_per_day, sharpe, allow_short)
+            ratio, shrp = _optimize(covariance, self.risk_free_rate_per_day, sharpe, allow_short, long_only)
             if allow_short:
                 symbol = min(ratio, key=lambda s: abs(ratio[s]))
                 if abs(ratio[symbol]) >= min_percent and len(ratio) <= max_count:
@@ -103,21 +134,21 @@ class Analysis:
                     return shrp, ratio, {s: similarity[s] for s in ratio}
             candidates.remove(symbol)
             similarity[corr.loc[symbol, candidates].idxmax()].add(symbol)
-            data = data[candidates]
+            covariance.remove(symbol)
         candidate = next(iter(candidates))
         shrp = (data[candidate].mean() - self.risk_free_rate_per_day) / data[candidate].std()
         return round(shrp, 4), {candidate: 1}, {candidate: similarity[candidate]}
 
     def optimize_iteration(self, group_ratios, min_percent=.2, max_count=5, additions=None,
-                           sharpe=True, allow_short=False):
+                           sharpe=True, allow_short=False, long_only=False):
         def try_and_try_again():
-            shrp, ratio, similarity = self.optimize(min_percent, max_count, sharpe, allow_short)
+            shrp, ratio, similarity = self.optimize(min_percent, max_count, sharpe, allow_short, long_only)
             if (shrp, ratio) not in ratios:
                 ratios.append((shrp, ratio))
             for symbol in ratio:
                 if similarity[symbol]:
                     self.setup_mask(ratio.keys() - {symbol} | similarity[symbol])
-                    s, r, _ = self.optimize(min_percent, max_count, sharpe, allow_short)
+                    s, r, _ = self.optimize(min_percent, max_count, sharpe, allow_short, long_only)
                     if (s, r) not in ratios:
                         ratios.append((s, r))
                 candidates.remove(symbol)
@@ -150,6 +181,29 @@ class Analysis:
             set(additions) if additions else set(),
         )
 
+    def sweep(self, settings, processes=None):
+        """
+        Runs optimize_iteration for each of the settings, dicts of its keyword arguments, in a process pool from the
+        current mask. The prices are shared with the workers instead of pickled, and the optimize results solved
+        by any run are merged back, so a mask seen before is not solved again.
+        """
+        keys = [_freeze(setting) for setting in settings]
+        unique = dict(zip(keys, settings))
+        full = self.data if self.origin_data is None else self.origin_data
+        memory = SharedMemory(create=True, size=max(full.values.nbytes, 1))
+        try:
+            ndarray(full.shape, dtype=float, buffer=memory.buf)[:] = full.values
+            with Pool(processes, _attach, (memory.name, full.shape, full.index, list(full.columns), self.period,
+                                           self.risk_free_rate_per_day, self.solved)) as pool:
+                results = dict(zip(unique, pool.starmap(
+                    _iterate, [(list(self.data.columns), setting) for setting in unique.values()])))
+        finally:
+            memory.close()
+            memory.unlink()
+        for _, solved in results.values():
+            self.solved.update(solved)
+        return [(setting, results[key][0]) for key, setting in zip(keys, settings)]
+
     @staticmethod
     def _combine_groups(ratios, group_ratios, previous):
         def dfs(index, skipped, covered, selected):
@@ -186,21 +240,21 @@ class Analysis:
         return [(i, *r) for i, rs in enumerate(results) for r in rs.values() if r[1]]
 
     @classmethod
-    def from_securities(cls, data_points, period=5, additions=None, **kwargs):
+    def from_securities(cls, data_points, period=5, additions=None, store=None, **kwargs):
         symbols = screen_securities(**kwargs)
         if additions:
             symbols += additions
-        return cls(symbols, data_points, period)
+        return cls(symbols, data_points, period, store=store)
 
     @classmethod
-    def from_funds(cls, data_points, period=5, additions=None, *, categories, **kwargs):
+    def from_funds(cls, data_points, period=5, additions=None, store=None, *, categories, **kwargs):
         symbols = reduce(concat, (screen_funds(*c.split(','), **kwargs) for c in categories))
         if additions:
             symbols += additions
-        return cls(symbols, data_points, period)
+        return cls(symbols, data_points, period, store=store)
 
     @classmethod
-    def from_hedge_funds(cls, data_points, period=5, additions=None, *, categories, **kwargs):
+    def from_hedge_funds(cls, data_points, period=5, additions=None, store=None, *, categories, **kwargs):
         symbols = []
         for category, securities in get_hedge_fund_replication_securities(**kwargs).items():
             print(f'{category} ({len(securities)} securities)')
@@ -216,7 +270,32 @@ class Analysis:
             if additions:
                 print(f'Additions: {additions}')
                 symbols += additions
-        return cls(symbols, data_points, period)
+        return cls(symbols, data_points, period, store=store)
+
+
+_worker = {}
+
+
+def _attach(name, shape, index, columns, period, risk_free_rate_per_day, solved):
+    memory = SharedMemory(name)
+    analysis = Analysis.__new__(Analysis)
+    analysis.data = DataFrame(ndarray(shape, dtype=float, buffer=memory.buf), index, columns, copy=False)
+    analysis.period, analysis.risk_free_rate_per_day = period, risk_free_rate_per_day
+    analysis.origin_data, analysis.solved = None, dict(solved)
+    _worker.update(memory=memory, analysis=analysis)  # the memory stays attached while the worker lives
+
+
+def _iterate(mask, setting):
+    analysis = _worker['analysis']
+    analysis.drop_mask()
+    analysis.setup_mask(mask)
+    known = set(analysis.solved)
+    result = analysis.optimize_iteration(**setting)
+    return result, {key: value for key, value in analysis.solved.items() if key not in known}
+
+
+def _freeze(setting):
+    return tuple(sorted((k, tuple(v) if isinstance(v, (list, set, tuple)) else v) for k, v in setting.items()))
 
 
 def _moving_average_statistics(frame, period, risk_free_rate_per_day=.008):
@@ -241,32 +320,69 @@ def _max_drawdown(series):
     return result
 
 
-def _optimize(data, risk_free_rate_per_day, sharpe, allow_short):
-    def calculate(target):
-        weights = ((B * one.T.dot(cov_inv) - A * mean.T.dot(cov_inv)) / (B * C - A * A) +
-                   (C * mean.T.dot(cov_inv) - A * one.T.dot(cov_inv)) / (B * C - A * A) * target)
-        if allow_short:
-            weights /= sum(w for w in weights if w > 0)
-        m, s = weights.T.dot(mean), weights.T.dot(cov).dot(weights) ** .5
-        r = ((m - risk_free_rate_per_day) / s) if sharpe else (1 / s)
-        return {k: round(v, 4) for k, v in weights.items()}, round(r, 4)
-
-    def attempt(guess):
-        if not allow_short and (guess < mean.min() or guess > mean.max()):
-            return float('inf')
-        _, r = calculate(guess)
-        if r <= 0:
-            return float('inf')
-        return 1 / r
+class _Covariance:
+    """
+    Mean and covariance of the returns with the inverse covariance, computed once for all the symbols. Removing a
+    symbol downdates the inverse by the Schur complement in O(n²), and a check every few removals falls back to a
+    full inverse once the relative residual shows numerical drift. A singular covariance, e.g. of fewer days than
+    symbols, is pseudo-inverted from the SVD of the centered returns instead, O(m²n) for m days.
+    """
+
+    def __init__(self, data):
+        self.mean, self.cov = data.mean(), data.cov()
+        self.inv, rank = _pinv(self.cov.values)
+        self.exact = rank == len(self.cov)
+        self.factor = None  # F with Σ = F'F, of a singular covariance with no gaps in the returns
+        rows = data.dropna(how='all')
+        if not self.exact and not rows.isna().values.any():
+            self.factor = (rows - rows.mean()).values / sqrt(len(rows) - 1)
+        self.downdates = self.recomputes = 0
+
+    def remove(self, symbol):
+        k = self.cov.columns.get_loc(symbol)
+        keep = arange(len(self.cov)) != k
+        self.mean = self.mean.drop(symbol)
+        self.cov = self.cov.drop(index=symbol, columns=symbol)
+        if self.factor is not None:
+            self.factor = self.factor[:, keep]
+            self.inv = _factor_pinv(self.factor)
+            return
+        pivot = self.inv[k, k]
+        self.downdates += 1
+        if self.exact and isfinite(pivot) and pivot > 0:
+            inv = self.inv[keep][:, keep] - outer(self.inv[keep, k], self.inv[k, keep]) / pivot
+            if self.downdates % DRIFT_CHECK_EVERY or _drift(self.cov.values, inv) < DRIFT_TOLERANCE:
+                self.inv = inv
+                return
+        self.recomputes += 1
+        self.inv, rank = _pinv(self.cov.values)
+        self.exact = rank == len(self.cov)
+
+
+def _pinv(matrix):
+    from scipy import linalg
+    return linalg.pinv(matrix, return_rank=True)
+
 
+def _factor_pinv(factor):
+    """ Pseudo-inverse of F'F, from the thin SVD of F. """
     from scipy import linalg
-    from scipy.optimize import minimize_scalar
-    mean, cov, one = data.mean(), data.cov(), ones(len(data.columns))
-    cov_inv = DataFrame(linalg.pinv(cov.values), cov.columns, cov.index)
-    A, B, C = one.T.dot(cov_inv).dot(mean), mean.T.dot(cov_inv).dot(mean), one.T.dot(cov_inv).dot(one)
-    if allow_short:
-        res = minimize_scalar(attempt)
+    _, s, vt = linalg.svd(factor, full_matrices=False)
+    kept = s > max(factor.shape) * finfo(float).eps * s.max() if len(s) else s > 0
+    return (vt[kept].T / s[kept] ** 2) @ vt[kept]
+
+
+def _drift(cov, inv):
+    """ The residual of Σ·Σ⁻¹ relative to ‖Σ‖·‖Σ⁻¹‖, near machine precision for a backward stable inverse. """
+    if not len(cov):
+        return 0.
+    return norm(cov @ inv - eye(len(cov)), 1) / (norm(cov, 1) * norm(inv, 1))
+
+
+def _optimize(covariance, risk_free_rate_per_day, sharpe, allow_short, long_only=False):
+    mean, cov = covariance.mean.values, covariance.cov.values
+    if long_only:
+        weights, r = long_only_portfolio(mean, cov, risk_free_rate_per_day, sharpe)
     else:
-        res = minimize_scalar(attempt, bounds=(mean.min(), mean.max()), method='Bounded')
-    assert res.success
-    return calculate(res.x)
+        weights, r = frontier_portfolio(mean, cov, covariance.inv, risk_free_rate_per_day, sharpe, allow_short)
+    return {k: round(v, 4) for k, v in zip(covariance.mean.index, weights.tolist())}, round(float(r), 4)
@@ -0,0 +1,54 @@
+from collections import namedtuple
+
+from numpy import arange, asarray, empty, flatnonzero
+
+Backtest = namedtuple('Backtest', 'equity days trades costs')
+CHUNK_DAYS = 256
+
+
+def rebalance(prices, weights, interval=15, threshold=3., cost=0., cash=0., cash_rate=0.):
+    """
+    Simulates a portfolio of 100 holding `weights` of `prices` (days x symbols), trading back to the weights on the
+    first day it drifted by `threshold` percent, at least `interval` days after the last rebalance. `cost` is the
+    fraction of the value traded paid as fees, `cash` the fraction kept uninvested, earning `cash_rate` per day.
+    Returns the equity per day, the days rebalanced with the shares traded, and the fees paid.
+
+    The holdings only change on the days rebalanced, so the segment in between is evaluated as matrix products,
+    scanned forward a chunk of days at a time until the first day drifted.
+    """
+    prices, weights = asarray(prices, dtype=float), asarray(weights, dtype=float)
+    growth = (1 + cash_rate) ** arange(len(prices))
+    equity = empty(len(prices))
+    shares, savings = 100 * (1 - cash) * weights / prices[0], 100 * cash  # cash is counted in units of growth
+    days, trades, costs = [], [], 0.
+    start, check = 0, 1
+    while True:
+        if interval <= 0 or check >= len(prices):
+            equity[start:] = prices[start:] @ shares + savings * growth[start:]
+            break
+        end = min(check + CHUNK_DAYS, len(prices))
+        equity[start:end] = prices[start:end] @ shares + savings * growth[start:end]
+        values = equity[check:end, None]
+        targets = values * (1 - cash) * weights / prices[check:end]
+        turnover = (abs(targets - shares) * prices[check:end]).sum(axis=1) / values[:, 0] * 100 / 2
+        drifted = flatnonzero(turnover >= threshold)
+        if not len(drifted):
+            start, check = end, end
+            continue
+        day = check + drifted[0]
+        fee = abs(targets[drifted[0]] - shares) @ prices[day] * cost
+        value = equity[day] - fee
+        target = value * (1 - cash) * weights / prices[day]
+        days.append(int(day))
+        trades.append(target - shares)
+        costs += fee
+        shares, savings = target, value * cash / growth[day]
+        start, check = day, day + interval
+    return Backtest(equity, days, trades, costs)
+
+
+def rebalance_grid(prices, weights, intervals, thresholds, **kwargs):
+    """ Backtests of every combination of rebalance interval and threshold, {(interval, threshold): Backtest}. """
+    prices = asarray(prices, dtype=float)
+    return {(interval, threshold): rebalance(prices, weights, interval, threshold, **kwargs)
+            for interval in intervals for threshold in thresholds}
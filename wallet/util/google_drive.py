@@ -1,5 +1,6 @@
 from flask import current_app
 
+from wallet.util.http_client import client
 from wallet.util.plivo import error_notifier, send
 
 SCOPES = ['https://www.googleapis.com/auth/drive']
@@ -30,7 +31,7 @@ def init_google_drive_service():
         'client_secret': current_app.config['GOOGLE_DRIVE_CLIENT_SECRET'],
     }
     credentials = Credentials.from_authorized_user_info(info, SCOPES)
-    credentials.refresh(Request())
+    credentials.refresh(Request(session=client('google')))
     return build('drive', 'v3', credentials=credentials)
 
 
@@ -44,3 +45,18 @@ def discover_new_files():
         if current_app.redis.setnx(f'google-drive:file-dedup:{file_id}', file_name):
             current_app.logger.info(f'new file discovered: {file_name}')
             send(f'发现新文件\n{file_name}')
+            current_app.queue.enqueue('wallet.model.statement.import_drive_file', file_id, file_name,
+                                      job_timeout=1800)
+
+
+def download_file(file_id):
+    from io import BytesIO
+    from googleapiclient.http import MediaIoBaseDownload
+    drive = init_google_drive_service()
+    stream = BytesIO()
+    downloader = MediaIoBaseDownload(stream, drive.files().get_media(fileId=file_id))
+    done = False
+    while not done:
+        _, done = downloader.next_chunk()
+    stream.seek(0)
+    return stream
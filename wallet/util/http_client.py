@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+from time import perf_counter
+from urllib.parse import urlparse
+
+from flask import current_app, has_app_context
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_TIMEOUT = (5, 30)  # connect, read
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+STATS_KEY = 'http-stats:{:%Y%m%d%H}'
+STATS_HOURS = 24
+_clients = {}
+
+
+class Client(Session):
+    """
+    A keep-alive session with a connection pool per host, a default timeout, retries with backoff on 429/5xx
+    and connection errors, and the time of every request recorded per host.
+    POST requests are only retried for APIs where they are safe to repeat.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, retry_post=False, pool_size=10):
+        super().__init__()
+        self.timeout = timeout
+        methods = Retry.DEFAULT_ALLOWED_METHODS | {'POST'} if retry_post else Retry.DEFAULT_ALLOWED_METHODS
+        retry = Retry(total=3, backoff_factor=.5, status_forcelist=RETRY_STATUSES, allowed_methods=methods,
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        started, status = perf_counter(), None
+        try:
+            response = super().request(method, url, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            _record(urlparse(url).netloc, perf_counter() - started, status)
+
+
+def client(name, **kwargs):
+    """ The client shared by everything calling the same service. """
+    if name not in _clients:
+        _clients[name] = Client(**kwargs)
+    return _clients[name]
+
+
+def http_stats(hours=STATS_HOURS):
+    """ Requests, failures and time per host, over the last hours. """
+    now = datetime.utcnow()
+    pipeline = current_app.redis.pipeline()
+    for i in range(hours):
+        pipeline.hgetall(STATS_KEY.format(now - timedelta(hours=i)))
+    result = {}
+    for stats in pipeline.execute():
+        for field, value in stats.items():
+            host, metric = field.decode().rsplit(':', 1)
+            entry = result.setdefault(host, {'requests': 0, 'failures': 0, 'ms': 0.})
+            entry[metric] += float(value) if metric == 'ms' else int(value)
+    for entry in result.values():
+        entry['avg_ms'] = round(entry.pop('ms') / entry['requests'], 1)
+    return result
+
+
+def _record(host, seconds, status):
+    if not has_app_context():
+        return
+    key = STATS_KEY.format(datetime.utcnow())
+    try:
+        pipeline = current_app.redis.pipeline()
+        pipeline.hincrby(key, f'{host}:requests', 1)
+        if status is None or status >= 400:
+            pipeline.hincrby(key, f'{host}:failures', 1)
+        pipeline.hincrbyfloat(key, f'{host}:ms', seconds * 1000)
+        pipeline.expire(key, 3600 * (STATS_HOURS + 1))
+        pipeline.execute()
+    except Exception as e:  # never fail the call for its statistics
+        current_app.logger.warning(f'failed to record http stats: {e!r}')
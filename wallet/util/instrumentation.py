@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta
+from time import perf_counter
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from flask.json import dumps, loads
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+STATS_KEY = 'sql-stats:{:%Y%m%d%H}'
+SLOW_QUERIES_KEY = 'sql-stats:slow'
+STATS_HOURS = 24
+SLOWEST_PER_REQUEST = 3
+
+
+class RequestStats:
+    """ Queries run while handling one request. """
+
+    def __init__(self, name):
+        self.name = name
+        self.started = perf_counter()
+        self.count = 0
+        self.db_time = 0.
+        self.slowest = []  # (seconds, statement), the slowest first
+
+    def add(self, statement, seconds):
+        self.count += 1
+        self.db_time += seconds
+        if len(self.slowest) < SLOWEST_PER_REQUEST or seconds > self.slowest[-1][0]:
+            self.slowest = sorted(self.slowest + [(seconds, statement)], reverse=True)[:SLOWEST_PER_REQUEST]
+
+    def server_timing(self):
+        total = perf_counter() - self.started
+        return (f'db;dur={self.db_time * 1000:.1f};desc="{self.count} queries", '
+                f'app;dur={(total - self.db_time) * 1000:.1f}')
+
+
+def init_app(app):
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+
+def rolling_stats(hours=STATS_HOURS):
+    """ Requests, queries and database time per endpoint or GraphQL operation, over the last hours. """
+    now = datetime.utcnow()
+    pipeline = current_app.redis.pipeline()
+    for i in range(hours):
+        pipeline.hgetall(STATS_KEY.format(now - timedelta(hours=i)))
+    result = {}
+    for stats in pipeline.execute():
+        for field, value in stats.items():
+            name, metric = field.decode().rsplit(':', 1)
+            entry = result.setdefault(name, {'requests': 0, 'queries': 0, 'db_ms': 0., 'max_db_ms': 0.})
+            if metric == 'max_db_ms':
+                entry[metric] = max(entry[metric], float(value))
+            else:
+                entry[metric] += float(value) if metric == 'db_ms' else int(value)
+    for entry in result.values():
+        entry['db_ms'] = round(entry['db_ms'], 1)
+        entry['avg_queries'] = round(entry['queries'] / entry['requests'], 1)
+        entry['avg_db_ms'] = round(entry['db_ms'] / entry['requests'], 1)
+    slow = [loads(query) for query in current_app.redis.lrange(SLOW_QUERIES_KEY, 0, -1)]
+    return {'operations': result, 'slow_queries': slow}
+
+
+def _before_request():
+    g.sql_stats = RequestStats(operation_name())
+
+
+def _after_request(response):
+    stats = g.pop('sql_stats', None)
+    if stats and stats.count:
+        response.headers.add('Server-Timing', stats.server_timing())
+        if stats.db_time * 1000 >= current_app.config['SLOW_QUERY_MS']:
+            current_app.logger.warning(f'slow request [{stats.name}] {stats.count} queries in '
+                                       f'{stats.db_time * 1000:.1f}ms, the slowest: ' +
+                                       '; '.join(f'{s * 1000:.1f}ms {q}' for s, q in stats.slowest))
+        try:
+            _record(stats)
+        except Exception as e:  # never fail the request for its statistics
+            current_app.logger.warning(f'failed to record sql stats: {e!r}')
+    return response
+
+
+def operation_name():
+    if request.path == '/q':
+        body = request.get_json(silent=True) if request.is_json else None
+        name = (body or {}).get('operationName') or request.args.get('operationName')
+        return f'graphql:{name or "anonymous"}'
+    return request.endpoint or request.path
+
+
+def _record(stats):
+    key = STATS_KEY.format(datetime.utcnow())
+    db_ms = stats.db_time * 1000
+    pipeline = current_app.redis.pipeline()
+    pipeline.hincrby(key, f'{stats.name}:requests', 1)
+    pipeline.hincrby(key, f'{stats.name}:queries', stats.count)
+    pipeline.hincrbyfloat(key, f'{stats.name}:db_ms', db_ms)
+    pipeline.expire(key, 3600 * (STATS_HOURS + 1))
+    pipeline.execute()
+    # there is no HMAX, a lost race only under-reports the maximum of that hour
+    current = current_app.redis.hget(key, f'{stats.name}:max_db_ms')
+    if not current or float(current) < db_ms:
+        current_app.redis.hset(key, f'{stats.name}:max_db_ms', db_ms)
+
+
+def _before_cursor_execute(conn, *_):
+    conn.info.setdefault('query_started', []).append(perf_counter())
+
+
+def _after_cursor_execute(conn, _, statement, parameters, *__):
+    seconds = perf_counter() - conn.info['query_started'].pop()
+    stats = g.get('sql_stats') if has_request_context() else None
+    if stats:
+        stats.add(statement, seconds)
+    if has_app_context() and seconds * 1000 >= current_app.config['SLOW_QUERY_MS']:
+        current_app.logger.warning(f'slow query {seconds * 1000:.1f}ms [{stats and stats.name}]: '
+                                   f'{statement} {parameters!r:.200}')
+        try:
+            pipeline = current_app.redis.pipeline()
+            pipeline.lpush(SLOW_QUERIES_KEY, dumps({
+                'time': datetime.utcnow().isoformat(timespec='seconds'), 'name': stats and stats.name,
+                'ms': round(seconds * 1000, 1), 'statement': statement,
+            }))
+            pipeline.ltrim(SLOW_QUERIES_KEY, 0, 99)
+            pipeline.execute()
+        except Exception as e:  # never fail the query for its statistics
+            current_app.logger.warning(f'failed to record slow query: {e!r}')
@@ -0,0 +1,37 @@
+from itertools import chain
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+LEDGER_VERSION = 'ledger:version'
+
+
+def init_app(_):
+    event.listen(Session, 'after_flush', _collect)
+    event.listen(Session, 'after_commit', _bump)
+    event.listen(Session, 'after_rollback', lambda session: session.info.pop('ledger_users', None))
+
+
+def ledger_version(user_id):
+    """ Bumped on every commit that touched the user's rows, to invalidate what is cached for them. """
+    return int(current_app.redis.hget(LEDGER_VERSION, user_id) or 0)
+
+
+def _collect(session, _):
+    users = session.info.setdefault('ledger_users', set())
+    for instance in chain(session.new, session.dirty, session.deleted):
+        user_id = getattr(instance, 'user_id', None)
+        if user_id is None and getattr(instance, 'account', None) is not None:
+            user_id = instance.account.user_id  # entries, balances and balance history
+        if user_id is not None:
+            users.add(user_id)
+
+
+def _bump(session):
+    users = session.info.pop('ledger_users', None)
+    if users and has_app_context():
+        with current_app.redis.pipeline() as pipe:
+            for user_id in users:
+                pipe.hincrby(LEDGER_VERSION, user_id, 1)
+            pipe.execute()
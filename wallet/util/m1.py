@@ -1,9 +1,11 @@
 from collections import defaultdict, namedtuple
 
 from flask import current_app
-from requests import post
+
+from wallet.util.http_client import client
 
 URL = 'https://lens.m1finance.com/graphql'
+_client = client('m1', retry_post=True)  # queries, and a token refresh that is safe to repeat
 
 
 def get_accounts():
@@ -45,7 +47,7 @@ def get_accounts():
         }
     '''
     variables = {'token': current_app.config['M1_TOKEN']}
-    json = post(URL, json={'query': query, 'variables': variables}).json()
+    json = _client.post(URL, json={'query': query, 'variables': variables}).json()
     if not json['data']['reauthenticate']['didSucceed']:
         raise ValueError(json['data']['reauthenticate']['error'] or 'Failed to load M1 accounts')
     # token = json['data']['reauthenticate']['outcome']['refreshToken']
@@ -78,7 +80,7 @@ def screen_securities(min_cap=None, min_pe=None, max_pe=None):
             }
         '''
         variables = {'after': after, 'minCap': min_cap, 'minPE': min_pe, 'maxPE': max_pe}
-        json = post(URL, json={'query': query, 'variables': variables}).json()
+        json = _client.post(URL, json={'query': query, 'variables': variables}).json()
         page = json['data']['viewer']['screenSecurities']['pageInfo']
         return ([n['node']['symbol'].replace('.', '-')
                  for n in json['data']['viewer']['screenSecurities']['edges']],
@@ -113,7 +115,7 @@ def screen_funds(*category, min_cap=1, max_exp=1):
     '''
     min_cap = min_cap * 1000000000 if min_cap else None
     variables = {'category': category, 'minCap': min_cap, 'maxExp': max_exp}
-    json = post(URL, json={'query': query, 'variables': variables}).json()
+    json = _client.post(URL, json={'query': query, 'variables': variables}).json()
     return [n['node']['symbol'].replace('.', '-')
             for n in json['data']['viewer']['screenFunds']['edges']]
 
@@ -145,7 +147,7 @@ def get_hedge_fund_replication_securities(max_cap=None, min_cap=None):
           }
         }
     '''
-    json = post(URL, json={'query': query}).json()
+    json = _client.post(URL, json={'query': query}).json()
     Security = namedtuple('Security', ['name', 'cap', 'pe', 'funds'])
     dd = defaultdict(dict)  # {category: {symbol: Security}}
     for n1 in json['data']['viewer']['screenSystemPies']['edges']:
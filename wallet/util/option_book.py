@@ -0,0 +1,132 @@
+from collections import namedtuple
+from datetime import datetime
+
+from numpy import around, arange, array, bincount, flatnonzero, isin, isnan, nan, nan_to_num, r_, unique, where, zeros
+
+Position = namedtuple('Position', 'name gain shares health gamma theta expiry maximum')
+Totals = namedtuple('Totals', 'gain theta shares gamma value maximum')
+Shock = namedtuple('Shock', 'shares gain')
+MARKET_FIELDS = ('mark_price', 'delta', 'gamma', 'theta')
+NAMES = {
+    'long_call_spread': 'Calls • {} Debit Spreads',
+    'long_put_spread': 'Puts • {} Debit Spreads',
+    'short_call_spread': 'Calls • {} Credit Spreads',
+    'short_put_spread': 'Puts • {} Credit Spreads',
+}
+
+
+class PositionBook:
+    """
+    Option spread positions stored column-wise, one row per leg and one per position. Greeks are aggregated per
+    symbol or expiry with one bincount, and an update recomputes only the positions whose market data changed.
+    """
+
+    def __init__(self, aggregates, prices, today):
+        self.symbols = sorted({position['symbol'] for position in aggregates})
+        self.expiries = sorted({expiry_of(position['legs'][0]) for position in aggregates})
+        self.prices = array([prices[symbol] for symbol in self.symbols], dtype=float)
+        names, symbol, expiry, quantity, cost, credit, maximum = [], [], [], [], [], [], []
+        leg_position, leg_sign, self.urls = [], [], []
+        for i, position in enumerate(aggregates):
+            legs = sorted(position['legs'], key=lambda leg: float(leg['strike_price']))
+            q = round(float(position['quantity']))
+            strike_prices = '/'.join(str(float(leg['strike_price'])) for leg in legs)
+            names.append(f'{position["symbol"]} {expiry_of(legs[0])} Exp • {strike_prices} '
+                         f'{NAMES[position["strategy"]].format(q)}')
+            symbol.append(self.symbols.index(position['symbol']))
+            expiry.append(self.expiries.index(expiry_of(legs[0])))
+            quantity.append(q)
+            cost.append(round(float(position['average_open_price']) * q))  # always positive
+            credit.append(position['direction'] == 'credit')
+            maximum.append(round(abs(float(legs[0]['strike_price']) - float(legs[1]['strike_price'])) * 100 * q))
+            for leg in legs:
+                leg_position.append(i)
+                leg_sign.append(1 if leg['position_type'] == 'long' else -1)
+                self.urls.append(leg['option'])
+        self.names = names
+        self.symbol, self.expiry = array(symbol, dtype=int), array(expiry, dtype=int)
+        self.quantity, self.cost = array(quantity, dtype=float), array(cost, dtype=float)
+        self.credit, self.maximum = array(credit, dtype=bool), array(maximum, dtype=float)
+        self.expiring = array([e == today for e in self.expiries], dtype=bool)[self.expiry]
+        self.leg_position, self.leg_sign = array(leg_position, dtype=int), array(leg_sign, dtype=float)
+        self.today = today
+        self.market = zeros((len(MARKET_FIELDS), len(self.urls))) + nan
+        self.gain, self.shares, self.health, self.gamma, self.theta = (zeros(len(names)) for _ in range(5))
+        self.computed = False
+
+    def same_positions(self, other):
+        """ Whether the other book holds the same legs in the same quantities, so it can be updated instead. """
+        return (self.today == other.today and self.names == other.names and self.urls == other.urls
+                and self.symbols == other.symbols and (self.cost == other.cost).all())
+
+    def update(self, market_data, prices=None):
+        """ Takes new market data {url: data} and prices {symbol: price}, returns the recomputed positions. """
+        market = array([[_float(market_data[url][field]) for url in self.urls] for field in MARKET_FIELDS])
+        same = (market == self.market) | (isnan(market) & isnan(self.market))
+        changed = unique(self.leg_position[~same.all(axis=0)])
+        if not self.computed:  # legs of no market data at all are still positions to report
+            changed = arange(len(self.names))
+        self.market = market
+        if prices:
+            new_prices = array([prices[symbol] for symbol in self.symbols], dtype=float)
+            moved = flatnonzero(new_prices != self.prices)
+            self.prices = new_prices
+            changed = unique(r_[changed, flatnonzero(isin(self.symbol, moved))])
+        if len(changed):
+            self._compute(changed)
+        self.computed = True
+        return changed
+
+    def _compute(self, positions):
+        legs = flatnonzero(isin(self.leg_position, positions))
+        owner = self.leg_position[legs]
+        sign, quantity, live = self.leg_sign[legs], self.quantity[owner], ~self.expiring[owner]
+        mark, delta, gamma, theta = (nan_to_num(self.market[i, legs]) for i in range(len(MARKET_FIELDS)))  # none as 0
+
+        def per_position(values):
+            return bincount(owner, weights=values, minlength=len(self.names))[positions]
+
+        equity = per_position(sign * around(mark * 100 * quantity))
+        shares = per_position(where(live, sign * delta * 100 * quantity, 0))
+        gamma = per_position(where(live, sign * gamma * quantity * self.prices[self.symbol[owner]], 0))  # per 1%
+        theta = per_position(where(live, sign * theta * 100 * quantity, 0))  # the change of equity per day
+        credit, cost, maximum = self.credit[positions], self.cost[positions], self.maximum[positions]
+        self.gain[positions] = equity + where(credit, cost, -cost)
+        self.health[positions] = around((where(credit, 1, 0) + equity / maximum) * 100)
+        self.shares[positions] = around(shares, 1)
+        self.gamma[positions] = around(gamma, 2)
+        self.theta[positions] = around(theta, 2)
+
+    def positions(self):
+        """ (symbol, Position) of every position. """
+        return [(self.symbols[s], Position(name, int(gain), shares, int(health), gamma, theta, self.expiries[e],
+                                           int(maximum)))
+                for name, s, e, gain, shares, health, gamma, theta, maximum in zip(
+                    self.names, self.symbol.tolist(), self.expiry.tolist(), self.gain.tolist(),
+                    self.shares.tolist(), self.health.tolist(), self.gamma.tolist(), self.theta.tolist(),
+                    self.maximum.tolist())]
+
+    def totals(self, by='symbol'):
+        keys, labels = (self.symbol, self.symbols) if by == 'symbol' else (self.expiry, self.expiries)
+        value = abs(self.shares) * self.prices[self.symbol]
+        columns = [bincount(keys, weights=column, minlength=len(labels))
+                   for column in (self.gain, self.theta, self.shares, self.gamma, value, self.maximum)]
+        return {label: Totals(int(round(gain)), theta, shares, gamma, value, int(maximum))
+                for label, gain, theta, shares, gamma, value, maximum in zip(labels, *(c.tolist() for c in columns))}
+
+    def shock(self, percent):
+        """ Shares and gain per symbol if the underlying moved by `percent`, estimated from delta and gamma. """
+        shares = self.shares + self.gamma * percent
+        gain = self.gain + self.prices[self.symbol] / 100 * (self.shares * percent + self.gamma * percent ** 2 / 2)
+        return {symbol: Shock(round(s, 1), round(g)) for symbol, s, g in zip(
+            self.symbols,
+            bincount(self.symbol, weights=shares, minlength=len(self.symbols)).tolist(),
+            bincount(self.symbol, weights=gain, minlength=len(self.symbols)).tolist())}
+
+
+def expiry_of(leg):
+    return datetime.fromisoformat(leg['expiration_date']).strftime('%m/%d')
+
+
+def _float(value):
+    return float(value) if value is not None else nan
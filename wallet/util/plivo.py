@@ -2,21 +2,22 @@ from functools import wraps
 from hashlib import md5
 
 from flask import current_app
-from requests import post
 from requests.auth import HTTPBasicAuth
 
+from wallet.util.http_client import client
+
 
 def send(text):
-    resp = post(f'https://api.plivo.com/v1/Account/{current_app.config["PLIVO_ID"]}/Message/',
-                auth=HTTPBasicAuth(
-                    current_app.config['PLIVO_ID'],
-                    current_app.config['PLIVO_TKN']
-                ),
-                data={
-                    'src': current_app.config['PLIVO_SRC'],
-                    'dst': current_app.config['PLIVO_DST'],
-                    'text': text
-                })
+    resp = client('plivo').post(f'https://api.plivo.com/v1/Account/{current_app.config["PLIVO_ID"]}/Message/',
+                                auth=HTTPBasicAuth(
+                                    current_app.config['PLIVO_ID'],
+                                    current_app.config['PLIVO_TKN']
+                                ),
+                                data={
+                                    'src': current_app.config['PLIVO_SRC'],
+                                    'dst': current_app.config['PLIVO_DST'],
+                                    'text': text
+                                })
     if resp.status_code >= 300:
         raise Exception(f'Failed to send plivo message. [{resp.status_code}]\n{resp.text}')
 
@@ -0,0 +1,63 @@
+from warnings import warn
+
+from numpy import clip, full, maximum, ones
+
+
+def frontier_portfolio(mean, cov, cov_inv, risk_free_rate, sharpe=True, allow_short=False):
+    """
+    Weights on the efficient frontier of `mean` returns and `cov` (with its inverse) maximizing the sharpe ratio,
+    or minimizing the variance, in closed form. Frontier weights are affine in the target return t,
+    w(t) = g + h * t, and the best target is
+      tangency: t = (B - rf * A) / (A - rf * C)    minimum variance: t = A / C
+    with A = 1'Σ⁻¹μ, B = μ'Σ⁻¹μ and C = 1'Σ⁻¹1. Without shorting the target is kept between the lowest and the
+    highest mean, where the ratio along the frontier peaks at the boundary nearest to it, and with shorting the
+    weights are scaled to a sum of 1 of the long ones. Returns (weights, ratio).
+    """
+    one = ones(len(mean))
+    inv_one, inv_mean = cov_inv @ one, cov_inv @ mean
+    a, b, c = one @ inv_mean, mean @ inv_mean, one @ inv_one
+    g, h = (b * inv_one - a * inv_mean) / (b * c - a * a), (c * inv_mean - a * inv_one) / (b * c - a * a)
+    if not sharpe:
+        target = a / c
+    elif a - risk_free_rate * c > 0:
+        target = (b - risk_free_rate * a) / (a - risk_free_rate * c)
+    else:  # the ratio keeps growing along the upper frontier
+        target = mean.max()
+    if not allow_short:
+        target = clip(target, mean.min(), mean.max())
+    weights = g + h * target
+    if allow_short:
+        weights = weights / weights[weights > 0].sum()
+    return weights, _ratio(weights, mean, cov, risk_free_rate, sharpe)
+
+
+def long_only_portfolio(mean, cov, risk_free_rate, sharpe=True):
+    """
+    Fully invested weights of no shorts maximizing the sharpe ratio, or minimizing the variance, solved as a
+    quadratic program. For the sharpe ratio, min y'Σy subject to (μ - rf)'y = 1 and y >= 0, then w = y / 1'y.
+    If the solver stops short of convergence, the better of its last iterate, projected back to fully invested
+    weights of no shorts, and the starting point is returned with a warning. Returns (weights, ratio).
+    """
+    from scipy.optimize import minimize
+    n = len(mean)
+    excess = mean - risk_free_rate
+    if sharpe and excess.max() <= 0:
+        weights = (excess == excess.max()) / (excess == excess.max()).sum()
+        return weights, _ratio(weights, mean, cov, risk_free_rate, sharpe)
+    budget = excess if sharpe else ones(n)
+    start = full(n, 1 / n) if not sharpe else maximum(excess, 0) / (maximum(excess, 0) @ excess)
+    result = minimize(lambda y: y @ cov @ y, start, jac=lambda y: 2 * cov @ y, method='SLSQP',
+                      bounds=[(0, None)] * n, constraints=[{'type': 'eq', 'fun': lambda y: budget @ y - 1,
+                                                            'jac': lambda _: budget}],
+                      options={'maxiter': max(100, 10 * n)})
+    weights = maximum(result.x, 0)
+    weights = weights / weights.sum() if weights.sum() > 0 else start / start.sum()
+    if not result.success:
+        warn(f'long only portfolio of {n} not converged: {result.message}')
+        weights = max(weights, start / start.sum(), key=lambda w: _ratio(w, mean, cov, risk_free_rate, sharpe))
+    return weights, _ratio(weights, mean, cov, risk_free_rate, sharpe)
+
+
+def _ratio(weights, mean, cov, risk_free_rate, sharpe):
+    deviation = (weights @ cov @ weights) ** .5
+    return ((weights @ mean - risk_free_rate) / deviation) if sharpe else (1 / deviation)
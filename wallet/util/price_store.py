@@ -0,0 +1,114 @@
+from datetime import date, timedelta
+from json import dump, loads
+from os import environ, makedirs, path, replace
+
+from numpy import array, concatenate, datetime64, dtype, intersect1d, isclose, load, save, searchsorted, unique
+from pandas import DataFrame, DatetimeIndex, Series
+
+ROOT = environ.get('PRICE_STORE', path.expanduser('~/.cache/wallet/prices'))
+RECORD = dtype([('date', 'datetime64[D]'), ('close', 'float64')])
+COVERAGE = 'coverage.json'
+
+
+class PriceStore:
+    """
+    Daily adjusted close prices kept locally, one memory-mapped numpy file per symbol. Only the days before or
+    after the range already fetched of a symbol are requested from the source, the rest is read from disk.
+    """
+
+    def __init__(self, root=ROOT, source=None):
+        self.root = root
+        self.source = source or yahoo
+        makedirs(root, exist_ok=True)
+        coverage_file = path.join(root, COVERAGE)
+        self.coverage = {}  # {symbol: [first, last]} of the days requested, trading or not
+        if path.exists(coverage_file):
+            with open(coverage_file) as f:
+                self.coverage = {symbol: [date.fromisoformat(d) for d in days]
+                                 for symbol, days in loads(f.read()).items()}
+
+    def load(self, symbols, start, end=None):
+        """ Adjusted closes from `start` to `end`, yesterday by default, as a frame of one column per symbol. """
+        end = end or date.today() - timedelta(days=1)  # the close of today is not final yet
+        start = start.date() if hasattr(start, 'date') else start
+        self.top_up(symbols, start, end)
+        columns = {}
+        for symbol in symbols:
+            records = self._read(symbol)
+            lo = searchsorted(records['date'], datetime64(start, 'D'), side='left')
+            hi = searchsorted(records['date'], datetime64(end, 'D'), side='right')
+            columns[symbol] = Series(records['close'][lo:hi], index=DatetimeIndex(records['date'][lo:hi]))
+        return DataFrame(columns)
+
+    def top_up(self, symbols, start, end):
+        """
+        Fetches the missing days of every symbol, a batch per distinct range. A range reaches into the stored
+        prices by a trading day, to tell whether a dividend or split has adjusted the history since.
+        """
+        batches = {}
+        for symbol in dict.fromkeys(symbols):
+            first, last = self.coverage.get(symbol, (None, None))
+            if first is None:
+                batches.setdefault((start, end), []).append(symbol)
+                continue
+            stored = self._read(symbol)['date']
+            if start < first:
+                batches.setdefault((start, stored[0].item() if len(stored) else first), []).append(symbol)
+            if end > last:
+                batches.setdefault((stored[-1].item() if len(stored) else last, end), []).append(symbol)
+        for (since, until), batch in batches.items():
+            frame = self.source(batch, since, until)
+            for symbol in batch:
+                self._merge(symbol, frame[symbol].dropna() if symbol in frame else Series(dtype=float))
+                first, last = self.coverage.get(symbol, (since, until))
+                self.coverage[symbol] = [min(first, since), max(last, until)]
+        if batches:
+            self._save_coverage()
+
+    def _merge(self, symbol, prices):
+        """ Adds the fetched prices, rescaling the stored ones if the close of a common day has been adjusted. """
+        fetched = array(list(zip(prices.index.values.astype('datetime64[D]'), prices.values)), dtype=RECORD)
+        stored = array(self._read(symbol))
+        _, i, j = intersect1d(stored['date'], fetched['date'], assume_unique=True, return_indices=True)
+        if len(i):
+            ratio = fetched['close'][j[-1]] / stored['close'][i[-1]]
+            if not isclose(ratio, 1):
+                stored['close'] *= ratio  # adjusted prices are all scaled back from the latest dividend or split
+        records = concatenate([fetched, stored])
+        _, first = unique(records['date'], return_index=True)  # the fetched one of a common day wins
+        self._write(symbol, records[first])
+
+    def _read(self, symbol):
+        file = self._file(symbol)
+        return load(file, mmap_mode='r') if path.exists(file) else array([], dtype=RECORD)
+
+    def _write(self, symbol, records):
+        file = self._file(symbol)
+        save(file + '.tmp.npy', records)
+        replace(file + '.tmp.npy', file)
+
+    def _save_coverage(self):
+        file = path.join(self.root, COVERAGE)
+        with open(file + '.tmp', 'w') as f:
+            dump({symbol: [d.isoformat() for d in days] for symbol, days in self.coverage.items()}, f)
+        replace(file + '.tmp', file)
+
+    def _file(self, symbol):
+        return path.join(self.root, f'{symbol.replace("/", "_")}.npy')
+
+
+def yahoo(symbols, start, end):
+    from pandas_datareader import DataReader
+    frame = DataReader(symbols, 'yahoo', start, end)['Adj Close']
+    return frame if isinstance(frame, DataFrame) else frame.to_frame(symbols[0])
+
+
+def offline(frame):
+    """ A source serving the prices of a frame, e.g. read from a csv fixture, with no network access. """
+
+    def source(symbols, start, end):
+        index = frame.index
+        return frame.loc[(index >= str(start)) & (index <= str(end)), [s for s in symbols if s in frame]]
+
+    return source
+
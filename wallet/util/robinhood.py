@@ -1,12 +1,34 @@
+import pickle
 from bisect import bisect_left
-from collections import defaultdict, namedtuple
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from itertools import chain
 from time import sleep
 
-from flask import current_app
-from requests import Session, get
+from flask import current_app, has_app_context
+from numpy import around, array, isfinite, isin, nan, nonzero, ones, triu
+
+from wallet.core import db
+from wallet.util.http_client import client
+from wallet.util.option_book import PositionBook, expiry_of
 
 HOST = 'https://api.robinhood.com'
+MAX_INSTRUMENTS = 40  # per market data request
+MAX_WORKERS = 8
+SPREADS_PER_WIDTH = 5
+SHOCKS = (-10, -5, 5, 10)  # percent moves of the underlying for what-if greeks
+BOOK_KEY = 'robinhood:position-book'
+BOOK_TTL = 86400
+SymbolPositions = namedtuple('SymbolPositions', 'symbol positions price chain')
+Spread = namedtuple('Spread', 'name shares price maximum health gamma theta expiry')
+# option type, ordered by descending strikes, whether the first leg's delta qualifies, name
+STRATEGIES = {
+    'long_call': ('call', True, lambda delta, ratio: delta >= ratio, 'Calls Debit Spread'),
+    'long_put': ('put', False, lambda delta, ratio: -delta >= ratio, 'Puts Debit Spread'),
+    'short_call': ('call', False, lambda delta, ratio: delta <= 1 - ratio, 'Calls Credit Spread'),
+    'short_put': ('put', True, lambda delta, ratio: -delta <= 1 - ratio, 'Puts Credit Spread'),
+}
 
 
 def init_app(app):
@@ -19,35 +41,35 @@ def init_app(app):
 def get_summary(output=print, verbose=True):
     req = _init_request_session()
 
-    positions = get_option_positions(req, [])
+    positions, book = _get_option_positions(req, [])
+    totals = book.totals('symbol')
     for item in sorted(positions.values(), key=lambda e: e.symbol):
-        shares = sum(pos.shares for pos in item.positions)
+        total = totals[item.symbol]
         output(f'{item.symbol} '
-               f'[Gain {sum(pos.gain for pos in item.positions)}, Theta {sum(pos.theta for pos in item.positions):.2f},'
-               f' Shares {shares:.1f}, Gamma {sum(pos.gamma for pos in item.positions):.2f},'
-               f' Price {item.price}, Value {shares * item.price:.0f},'
-               f' Collateral {sum(pos.maximum for pos in item.positions)}]:')
+               f'[Gain {total.gain}, Theta {total.theta:.2f},'
+               f' Shares {total.shares:.1f}, Gamma {total.gamma:.2f},'
+               f' Price {item.price}, Value {total.shares * item.price:.0f},'
+               f' Collateral {total.maximum}]:')
         if verbose:
             for pos in sorted(item.positions, key=lambda e: e.name):
                 output(f' - {pos.name} '
                        f'[Gain {pos.gain}, Theta {pos.theta},'
                        f' Shares {pos.shares}, Gamma {pos.gamma},'
                        f' Health {pos.health}%]')
+    if verbose:
+        shocks = [(percent, book.shock(percent)) for percent in SHOCKS]
+        for symbol in book.symbols:
+            output(f'{symbol} if moved ' + ', '.join(f'{percent:+d}%: Shares {shock[symbol].shares:.1f}'
+                                                      f' Gain {shock[symbol].gain}' for percent, shock in shocks))
 
     output()
-    dd = defaultdict(lambda: [0, 0, 0, 0])
-    for item in positions.values():
-        for pos in item.positions:
-            dd[pos.expiry][0] += pos.gain
-            dd[pos.expiry][1] += pos.theta
-            dd[pos.expiry][2] += abs(pos.shares) * item.price
-            dd[pos.expiry][3] += pos.maximum
+    dd = book.totals('expiry')
     today = datetime.today()
     days = {0: 4, 1: 3, 2: 2, 3: 1, 4: 7, 5: 6, 6: 5}[today.weekday()]
     selloff_date = (today + timedelta(days=days + 14)).strftime('%m/%d')
     for expiry in sorted(dd):
-        output(f'Week {expiry}\'s Gain: {dd[expiry][0]}, Theta: {dd[expiry][1]:.2f},'
-               f' Value: {dd[expiry][2]:.0f}, Collateral: {dd[expiry][3]}'
+        output(f'Week {expiry}\'s Gain: {dd[expiry].gain}, Theta: {dd[expiry].theta:.2f},'
+               f' Value: {dd[expiry].value:.0f}, Collateral: {dd[expiry].maximum}'
                f'{"  <<<<" if expiry == selloff_date else ""}')
 
     #expiry_date = (today + timedelta(days=days)).strftime('%m/%d')
@@ -71,6 +93,7 @@ def get_summary(output=print, verbose=True):
     output()
     buy_date = datetime(2021, 6, 18)
     list_spreads('ARKK', 'short_put', positions['ARKK'].price, positions['ARKK'].chain, .4, [15], buy_date)
+    db.session.commit()  # the option listings and market data snapshots
     #days = 35 + {0: 4, 1: 3, 2: 2, 3: 1, 4: 7, 5: 6, 6: 5}[today.weekday()]
     #buy_date = (today + timedelta(days=days))
     #buy_date_str = buy_date.strftime('%m/%d')
@@ -102,120 +125,125 @@ def get_summary_with_notif():
 
 
 def get_option_positions(req, additions):
-    Position = namedtuple('Position', 'name gain shares health gamma theta expiry maximum')
-    SymbolPositions = namedtuple('SymbolPositions', 'symbol positions price chain')
-    positions = {}  # symbol:SymbolPositions
-
-    for position in _paginate(req, f'{HOST}/options/aggregate_positions/'):
-        symbol, quantity, legs = position['symbol'], round(float(position['quantity'])), position['legs']
-        if quantity == 0 or len(legs) != 2:
-            continue
-        legs = sorted(legs, key=lambda leg: float(leg['strike_price']))
-        if symbol not in positions:
-            price = float(req.get(f'{HOST}/marketdata/quotes/{symbol}/').json()['last_trade_price'])
-            positions[symbol] = SymbolPositions(symbol, [], price, position['chain'][-37:-1])
-        else:
-            price = positions[symbol].price
-
-        expiry = datetime.fromisoformat(legs[0]['expiration_date']).strftime('%m/%d')
-        expiring_today = expiry == datetime.today().strftime('%m/%d')
-        market_data = _get_options_market_data(req, [leg['option'] for leg in legs], allow_none=expiring_today)
-        maximum = round(abs(float(legs[0]['strike_price']) - float(legs[1]['strike_price'])) * 100 * quantity)
-        strike_prices = '/'.join(str(float(leg['strike_price'])) for leg in legs)
-        name = {
-            'long_call_spread': lambda: f'{symbol} {expiry} Exp • {strike_prices} Calls • {quantity} Debit Spreads',
-            'long_put_spread': lambda: f'{symbol} {expiry} Exp • {strike_prices} Puts • {quantity} Debit Spreads',
-            'short_call_spread': lambda: f'{symbol} {expiry} Exp • {strike_prices} Calls • {quantity} Credit Spreads',
-            'short_put_spread': lambda: f'{symbol} {expiry} Exp • {strike_prices} Puts • {quantity} Credit Spreads',
-        }[position['strategy']]()
-        equity, shares, gamma, theta = 0, 0, 0, 0
-        for i, leg in enumerate(legs):
-            data = market_data[i]
-            if leg['position_type'] == 'long':
-                equity += round(float(data['mark_price']) * 100 * quantity)
-                if not expiring_today:
-                    shares += float(data['delta']) * 100 * quantity
-                    gamma += float(data['gamma']) * quantity * price  # the change of shares per 1%
-                    theta += float(data['theta']) * 100 * quantity  # the change of equity per day
-            else:
-                equity -= round(float(data['mark_price']) * 100 * quantity)
-                if not expiring_today:
-                    shares -= float(data['delta']) * 100 * quantity
-                    gamma -= float(data['gamma']) * quantity * price  # the change of shares per 1%
-                    theta -= float(data['theta']) * 100 * quantity  # the change of equity per day
-        cost = round(float(position['average_open_price']) * quantity)  # always positive
-        gain = equity - cost
-        health = equity / maximum
-        if position['direction'] == 'credit':
-            gain = equity + cost
-            health = 1 + equity / maximum
-        positions[symbol].positions.append(Position(name, gain, round(shares, 1),
-                                                    round(health * 100), round(gamma, 2), round(theta, 2),
-                                                    expiry, maximum))
-
-    for symbol in additions:
-        if symbol not in positions:
-            price = float(req.get(f'{HOST}/marketdata/quotes/{symbol}/').json()['last_trade_price'])
-            chain = req.get(f'{HOST}/instruments/', params={'symbol': symbol}).json()['results'][0]['tradable_chain_id']
-            positions[symbol] = SymbolPositions(symbol, [], price, chain)
-
-    return positions
-
-
-def find_option_spreads(req, strategy, chain_id, expiry_date, stock_price, ratio1, intervals):
-    option_type = 'call' if 'call' in strategy else 'put'
-    params = {'state': 'active', 'type': option_type, 'chain_id': chain_id, 'expiration_dates': expiry_date}
-    options = sorted((float(option['strike_price']), option['url'])
-                     for option in _paginate(req, f'{HOST}/options/instruments/', params))
-    i = bisect_left(options, (stock_price, ''))
-    options = {
-        'long_call': lambda: options[max(0, i - 16):i + 16][::-1],
-        'long_put': lambda: options[max(0, i - 16):i + 16],
-        'short_call': lambda: options[max(0, i - 16):i + 16],
-        'short_put': lambda: options[max(0, i - 16):i + 16][::-1],
-    }[strategy]()
-    market_data = _get_options_market_data(req, [option[1] for option in options])
-    Option = namedtuple('Option', 'strike_price mark_price delta gamma theta')
-    options = [Option(option[0], float(market_data[i]['mark_price']), float(market_data[i]['delta']),
-                      float(market_data[i]['gamma']), float(market_data[i]['theta']))
-               for i, option in enumerate(options)]
-
-    Spread = namedtuple('Spread', 'name shares price maximum health gamma theta')
-    spreads = []
-    for i in range(len(options)):
-        if {
-            'long_call': lambda: options[i].delta < ratio1,
-            'long_put': lambda: -options[i].delta < ratio1,
-            'short_call': lambda: options[i].delta > 1 - ratio1,
-            'short_put': lambda: -options[i].delta > 1 - ratio1,
-        }[strategy]():
-            continue
-        if options[i].strike_price % 5 != 0:
-            continue
-        for j in range(i + 1, len(options)):
-            shares = (options[j].delta - options[i].delta) * 100
-            price = round(options[j].mark_price - options[i].mark_price, 2)
-            maximum = round(abs(options[j].strike_price - options[i].strike_price), 2)
-            if maximum not in intervals:
-                continue
-            gamma = round((options[j].gamma - options[i].gamma) * stock_price, 2)
-            theta = round((options[j].theta - options[i].theta) * 100, 2)
-            health = price / maximum
-            if 'short' in strategy:
-                health = 1 + price / maximum
-            strike_prices = f'{options[j].strike_price}/{options[i].strike_price}'
-            name = {
-                'long_call': lambda: f'{strike_prices} Calls Debit Spread',
-                'long_put': lambda: f'{strike_prices} Puts Debit Spread',
-                'short_call': lambda: f'{strike_prices} Calls Credit Spread',
-                'short_put': lambda: f'{strike_prices} Puts Credit Spread',
-            }[strategy]()
-            spreads.append(Spread(name, round(shares, 1), price, maximum, round(health * 100), gamma, theta))
-    spreads.sort(key=lambda c: (c.maximum, c.health))
-    interval_backlogs = 5
+    return _get_option_positions(req, additions)[0]
+
+
+def _get_option_positions(req, additions):
+    # collect everything to fetch first, then fetch quotes, chains and all legs' market data together
+    aggregates = [position for position in _paginate(req, f'{HOST}/options/aggregate_positions/')
+                  if round(float(position['quantity'])) != 0 and len(position['legs']) == 2]
+    symbols = {position['symbol'] for position in aggregates}
+    today = datetime.today().strftime('%m/%d')
+    options = list(dict.fromkeys(leg['option'] for position in aggregates for leg in position['legs']))
+    expiring = {leg['option'] for position in aggregates for leg in position['legs'] if expiry_of(leg) == today}
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        prices = executor.submit(_get_quotes, req, symbols | set(additions))
+        chains = executor.submit(lambda: {symbol: _get_chain_id(req, symbol)
+                                          for symbol in additions if symbol not in symbols})
+        market_data = _get_options_market_data(req, options, allow_none=expiring)
+        prices, chains = prices.result(), {**chains.result(), **{position['symbol']: position['chain'][-37:-1]
+                                                                  for position in aggregates}}
+    _record_snapshots(options, market_data)
+
+    book = _position_book(PositionBook(aggregates, prices, today), dict(zip(options, market_data)), prices)
+    positions = {symbol: SymbolPositions(symbol, [], prices[symbol], chains[symbol])
+                 for symbol in sorted(symbols | set(additions))}  # symbol:SymbolPositions
+    for symbol, position in book.positions():
+        positions[symbol].positions.append(position)
+    return positions, book
+
+
+def _position_book(book, market_data, prices):
+    """
+    Within the app, the book of the previous poll is kept in redis (each job runs in a new worker process). While
+    the positions stay the same, only those whose legs' market data or underlying price changed are recomputed.
+    """
+    previous = current_app.redis.get(BOOK_KEY) if has_app_context() else None
+    try:
+        previous = previous and pickle.loads(previous)
+        if previous and previous.same_positions(book):
+            book = previous
+    except (AttributeError, pickle.UnpicklingError):  # pickled by an older version
+        pass
+    changed = book.update(market_data, prices)
+    if has_app_context():
+        current_app.redis.set(BOOK_KEY, pickle.dumps(book), ex=BOOK_TTL)
+        current_app.logger.info(f'{len(changed)} of {len(book.names)} option positions recomputed')
+    return book
+
+
+def find_option_spreads(req, strategy, chain_id, expiry_dates, stock_price, ratio1, intervals, window=16):
+    return scan_option_spreads(req, strategy, {None: (chain_id, stock_price)},
+                               expiry_dates, ratio1, intervals, window)[None]
+
+
+def scan_option_spreads(req, strategy, chains, expiry_dates, ratio1, intervals, window=16):
+    """
+    Spreads of each symbol's chain {symbol: (chain_id, stock_price)} for one or more expiry dates,
+    among `window` strikes on each side of the stock price, or across the whole chain if None.
+    """
+    option_type, descending, _, _ = STRATEGIES[strategy]
+    expiry_dates = [expiry_dates] if isinstance(expiry_dates, str) else expiry_dates
+
+    groups = {}  # (symbol, expiry date): [(strike price, url)]
+    for symbol, options in zip(chains, _list_options(req, option_type, [c for c, _ in chains.values()],
+                                                     expiry_dates)):
+        for expiry_date, strike_price, url in options:
+            groups.setdefault((symbol, expiry_date), []).append((strike_price, url))
+    for (symbol, _), options in groups.items():
+        options.sort()
+        if window:
+            i = bisect_left(options, (chains[symbol][1], ''))
+            options[:] = options[max(0, i - window):i + window]
+        if descending:
+            options.reverse()
+
+    urls = [url for options in groups.values() for _, url in options]
+    market_data = _get_options_market_data(req, urls, allow_none=() if window else set(urls))  # far from the money
+    _record_snapshots(urls, market_data)
+    market_data = dict(zip(urls, market_data))
+    found = {symbol: [] for symbol in chains}
+    for (symbol, expiry_date), options in groups.items():
+        found[symbol] += _spreads(strategy, options, [market_data[url] for _, url in options],
+                                  chains[symbol][1], ratio1, intervals, expiry_date)
+    return {symbol: _shortlist(spreads) for symbol, spreads in found.items()}
+
+
+def _spreads(strategy, options, market_data, stock_price, ratio1, intervals, expiry_date):
+    """ Every pair (i, j) of the options ordered for the strategy, as matrices indexed [i, j]. """
+    _, _, eligible, label = STRATEGIES[strategy]
+    strikes = array([strike for strike, _ in options])
+    mark, delta, gamma, theta = (array([float(data[field] or nan) for data in market_data])
+                                 for field in ('mark_price', 'delta', 'gamma', 'theta'))
+    complete = isfinite(mark) & isfinite(delta) & isfinite(gamma) & isfinite(theta)  # no greeks when illiquid
+    width = around(abs(strikes[None, :] - strikes[:, None]), 2)
+    mask = (triu(ones(width.shape, dtype=bool), 1)
+            & (complete & eligible(delta, ratio1) & (strikes % 5 == 0))[:, None]
+            & complete[None, :]
+            & isin(width, intervals))
+    i, j = nonzero(mask)
+    price = around(mark[j] - mark[i], 2)
+    health = price / width[i, j] + (1 if strategy.startswith('short') else 0)
+    columns = (
+        around((delta[j] - delta[i]) * 100, 1),
+        price,
+        width[i, j],
+        around(health * 100).astype(int),
+        around((gamma[j] - gamma[i]) * stock_price, 2),
+        around((theta[j] - theta[i]) * 100, 2),
+    )
+    names = [f'{high}/{low} {label}' for high, low in zip(strikes[j].tolist(), strikes[i].tolist())]
+    return [Spread(name, *row, expiry_date) for name, *row in zip(names, *(c.tolist() for c in columns))]
+
+
+def _shortlist(spreads):
+    """ The healthiest few spreads of each expiry date and width. """
+    spreads.sort(key=lambda c: (c.expiry, c.maximum, c.health))
     result = []
     for spread in spreads:
-        if len(result) < interval_backlogs or result[-interval_backlogs].maximum != spread.maximum:
+        if (len(result) < SPREADS_PER_WIDTH
+                or (result[-SPREADS_PER_WIDTH].expiry, result[-SPREADS_PER_WIDTH].maximum)
+                != (spread.expiry, spread.maximum)):
             result.append(spread)
     return result
 
@@ -237,7 +265,7 @@ def get_portfolio():
 
 
 def _init_request_session():
-    req = Session()
+    req = client('robinhood')
     req.headers['Authorization'] = f'Bearer {current_app.config["RH_TOKEN"]}'
     req.headers['User-Agent'] = ('Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_4) AppleWebKit/537.36'
                                  ' (KHTML, like Gecko) Chrome/81.0.4044.138 Safari/537.36')
@@ -247,21 +275,73 @@ def _init_request_session():
     return req
 
 
-def _get_options_market_data(req, option_list, allow_none=False):
+def _get_options_market_data(req, option_list, allow_none=()):
+    """ The median (by delta) of repeated snapshots of each option, all options sampled together in each round. """
+    if not option_list:
+        return []
+    chunks = [option_list[i:i + MAX_INSTRUMENTS] for i in range(0, len(option_list), MAX_INSTRUMENTS)]
     result = [[] for _ in range(len(option_list))]
-    for _ in range(15):
-        market_data = req.get(f'{HOST}/marketdata/options/',
-                              params={'instruments': ','.join(option_list)}).json()['results']
-        for i, data in enumerate(market_data):
-            if data['delta'] is not None or allow_none:
-                result[i].append(data)
-        if all(len(data_list) >= 11 for data_list in result):
-            break
-        sleep(.1)
+    with ThreadPoolExecutor(max_workers=min(len(chunks), MAX_WORKERS)) as executor:
+        for _ in range(15):
+            market_data = chain.from_iterable(executor.map(
+                lambda chunk: req.get(f'{HOST}/marketdata/options/',
+                                      params={'instruments': ','.join(chunk)}).json()['results'], chunks))
+            for i, data in enumerate(market_data):
+                if data['delta'] is not None or option_list[i] in allow_none:
+                    result[i].append(data)
+            if all(len(data_list) >= 11 for data_list in result):
+                break
+            sleep(.1)
     assert min(len(data_list) for data_list in result) > 2
     return [sorted(data_list, key=lambda d: float(d['delta']) if d['delta'] else 0)[len(data_list) // 2] for data_list in result]
 
 
+def _list_options(req, option_type, chain_ids, expiry_dates):
+    """
+    Options of each chain as (expiry date, strike price, url). Within the app, the listings are stored and only the
+    expiry dates not listed within the TTL are fetched.
+    """
+    def fetch(chain_id, dates):
+        if not dates:
+            return []
+        params = {'state': 'active', 'type': option_type, 'chain_id': chain_id, 'expiration_dates': ','.join(dates)}
+        return [(option['expiration_date'], float(option['strike_price']), option['url'])
+                for option in _paginate(req, f'{HOST}/options/instruments/', params)]
+
+    if not chain_ids:
+        return []
+    stored = has_app_context()
+    if stored:
+        from wallet.model.option import OptionInstrument
+        stale = [OptionInstrument.stale_dates(chain_id, option_type, expiry_dates) for chain_id in chain_ids]
+    else:
+        stale = [expiry_dates] * len(chain_ids)
+    with ThreadPoolExecutor(max_workers=min(len(chain_ids), MAX_WORKERS)) as executor:
+        fetched = list(executor.map(fetch, chain_ids, stale))
+    if not stored:
+        return fetched
+    for chain_id, dates, options in zip(chain_ids, stale, fetched):
+        OptionInstrument.replace(chain_id, option_type, dates, options)
+    return [OptionInstrument.get_list(chain_id, option_type, expiry_dates) for chain_id in chain_ids]
+
+
+def _record_snapshots(urls, market_data):
+    if has_app_context():
+        from wallet.model.option import OptionSnapshot
+        OptionSnapshot.record(urls, market_data)
+
+
+def _get_quotes(req, symbols):
+    if not symbols:
+        return {}
+    quotes = req.get(f'{HOST}/marketdata/quotes/', params={'symbols': ','.join(sorted(symbols))}).json()['results']
+    return {quote['symbol']: float(quote['last_trade_price']) for quote in quotes if quote}
+
+
+def _get_chain_id(req, symbol):
+    return req.get(f'{HOST}/instruments/', params={'symbol': symbol}).json()['results'][0]['tradable_chain_id']
+
+
 def _paginate(req, url, params=None):
     result = req.get(url, params=params).json()
     if 'results' not in result:
@@ -269,6 +349,6 @@ def _paginate(req, url, params=None):
     for item in result['results']:
         yield item
     while result['next']:
-        result = get(result['next']).json()
+        result = req.get(result['next']).json()
         for item in result['results']:
             yield item
@@ -4,12 +4,13 @@ from time import sleep
 
 from click import argument
 from flask import current_app
-from flask.json import loads
-from requests import session
+from flask.json import dumps, loads
+
+from wallet.util.http_client import client
 
 HOST = 'https://theswapsy.com'
 Trade = namedtuple('Trade', 'trade_id amount receive_amount rate actual_rate')
-swapsy_session = session()
+swapsy_session = client('swapsy')
 swapsy_session.csrf = None
 swapsy_session.block = None
 
@@ -128,14 +129,46 @@ def _obj_to_form(obj, prefix, result):
 
 
 def exchange_rate():
-    return float(_regex_search(swapsy_session.get(HOST), b'exchange_rates:', b'"USD:CNY":([.0-9]+),'))
+    resp = swapsy_session.get(HOST, timeout=10)
+    return float(_regex_search(resp, b'exchange_rates:', b'"USD:CNY":([.0-9]+),'))
 
 
 def cached_exchange_rate():
+    """ Never blocks on the network once a rate has been persisted; stale rates are refreshed in background. """
     now = datetime.utcnow().timestamp()
-    if now - _cache[1] > 3600:
-        _cache[:] = round(exchange_rate(), 4), now
+    if now - _cache[1] > LOCAL_TTL:
+        cached = current_app.redis.get(RATE_KEY)
+        if cached:
+            rate, updated = loads(cached)
+            if now - updated > RATE_TTL:
+                _schedule_refresh()
+        else:
+            rate = refresh_exchange_rate()
+        _cache[:] = rate, now
     return _cache[0]
 
 
+def refresh_exchange_rate():
+    try:
+        rate = round(exchange_rate(), 4)
+    except Exception:
+        # keep the refresh lock for a growing period, so that a failing site is not hammered
+        failures = current_app.redis.incr(FAILURES_KEY)
+        current_app.redis.set(REFRESH_LOCK_KEY, failures, ex=min(60 * 2 ** failures, RATE_TTL))
+        raise
+    current_app.redis.set(RATE_KEY, dumps([rate, datetime.utcnow().timestamp()]))
+    current_app.redis.delete(FAILURES_KEY, REFRESH_LOCK_KEY)
+    return rate
+
+
+def _schedule_refresh():
+    if current_app.redis.set(REFRESH_LOCK_KEY, 0, ex=300, nx=True):
+        current_app.queue.enqueue(refresh_exchange_rate)
+
+
+RATE_KEY = 'swapsy:exchange-rate'
+REFRESH_LOCK_KEY = 'swapsy:exchange-rate:refresh'
+FAILURES_KEY = 'swapsy:exchange-rate:failures'
+RATE_TTL = 3600
+LOCAL_TTL = 60
 _cache = [0, 0]
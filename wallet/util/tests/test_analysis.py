@@ -0,0 +1,103 @@
+from datetime import date, timedelta
+from multiprocessing import pool
+
+from numpy import allclose, cumprod
+from numpy.random import default_rng
+from pandas import DataFrame, bdate_range
+from pytest import raises
+from scipy.linalg import pinv
+
+from wallet.util import analysis as analysis_module
+from wallet.util.analysis import Analysis, _Covariance
+from wallet.util.price_store import PriceStore, offline
+
+RNG = default_rng(3)
+RETURNS = DataFrame(RNG.normal(0, 1, (300, 40)), columns=[f'S{i}' for i in range(40)])
+# one market factor and a little idiosyncratic noise, a condition number around 1e9
+CORRELATED = DataFrame(RNG.normal(0, 1, (300, 1)) * RNG.uniform(.8, 1.2, 60) + RNG.normal(0, 1e-4, (300, 60)),
+                       columns=[f'S{i}' for i in range(60)])
+DAYS = bdate_range(end=date.today() - timedelta(days=1), periods=250)
+PRICES = DataFrame(cumprod(1 + RNG.normal(.0005, .015, (len(DAYS), 8)), axis=0) * 100, index=DAYS,
+                   columns=['SPY', 'TLT', 'GLD', 'QQQ', 'IWM', 'EFA', 'VNQ', 'LQD'])
+REMOVED = [5, 0, 39, 17, 8, 22, 1, 30, 12, 3, 9, 27, 14, 33, 20, 2, 36, 11, 25, 7, 31]  # past two drift checks
+
+
+def _close(inv, expected, tolerance=1e-6):
+    return abs(inv - expected).max() <= tolerance * abs(expected).max()
+
+
+def test_downdated_inverse():
+    covariance = _Covariance(RETURNS)
+    assert covariance.exact
+    removed = [f'S{i}' for i in REMOVED]
+    for symbol in removed:
+        covariance.remove(symbol)
+    kept = [column for column in RETURNS.columns if column not in removed]
+    assert list(covariance.cov.columns) == kept and list(covariance.mean.index) == kept
+    assert covariance.recomputes == 0
+    assert allclose(covariance.inv, pinv(RETURNS[kept].cov().values))
+
+
+def test_ill_conditioned_downdates():
+    covariance = _Covariance(CORRELATED)
+    assert covariance.exact
+    removed = [f'S{i}' for i in REMOVED]
+    for symbol in removed:
+        covariance.remove(symbol)
+    assert covariance.downdates == len(removed) and covariance.recomputes == 0
+    assert _close(covariance.inv, pinv(CORRELATED.drop(columns=removed).cov().values), 1e-4)
+
+
+def test_singular_covariance():
+    returns = RETURNS.iloc[:, :5].assign(SUM=RETURNS.iloc[:, :5].sum(axis=1))
+    covariance = _Covariance(returns)
+    assert not covariance.exact
+    covariance.remove('S0')
+    assert allclose(covariance.inv, pinv(returns.drop(columns='S0').cov().values))
+
+
+def test_fewer_days_than_symbols():
+    returns = RETURNS.iloc[:20].copy()
+    returns.iloc[:3] = None  # the leading days of a rolling mean
+    covariance = _Covariance(returns)
+    assert not covariance.exact and covariance.factor is not None
+    assert _close(covariance.inv, pinv(returns.cov().values))
+    removed = [f'S{i}' for i in REMOVED[:10]]
+    for symbol in removed:
+        covariance.remove(symbol)
+    assert covariance.factor.shape == (17, 30)
+    assert _close(covariance.inv, pinv(returns.drop(columns=removed).cov().values))
+
+
+def test_optimize_cached(tmp_path):
+    analysis = Analysis(list(PRICES.columns), 120, 5, store=PriceStore(str(tmp_path), offline(PRICES)))
+    first = analysis.optimize(max_count=3)
+    assert analysis.optimize(max_count=3) is first
+    analysis.risk_free_rate_per_day *= 2
+    assert analysis.optimize(max_count=3) is not first
+    analysis.period = 10
+    assert analysis.optimize(max_count=3) is not first and len(analysis.solved) == 3
+    with raises(ValueError):
+        analysis.optimize(allow_short=True, long_only=True)
+
+
+def test_sweep(tmp_path, monkeypatch):
+    runs = []
+
+    class CountingPool(pool.Pool):
+        def starmap(self, func, iterable, chunksize=None):
+            iterable = list(iterable)
+            runs.append(len(iterable))
+            return super().starmap(func, iterable, chunksize)
+
+    monkeypatch.setattr(analysis_module, 'Pool', CountingPool)
+    store = PriceStore(str(tmp_path), offline(PRICES))
+    settings = [{'group_ratios': [50, 50], 'max_count': 3}, {'group_ratios': [100], 'min_percent': .1},
+                {'max_count': 3, 'group_ratios': [50, 50]}]
+    analysis = Analysis(list(PRICES.columns), 120, 5, store=store)
+    swept = analysis.sweep(settings, processes=2)
+    assert runs == [2]
+    assert [setting for setting, _ in swept] == settings and swept[0][1] == swept[2][1]
+    assert analysis.solved  # merged back from the workers
+    for setting, result in swept[:2]:
+        assert result == Analysis(list(PRICES.columns), 120, 5, store=store).optimize_iteration(**setting)
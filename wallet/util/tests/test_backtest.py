@@ -0,0 +1,57 @@
+from numpy import allclose, array, cumprod
+from numpy.random import default_rng
+
+from wallet.util import backtest
+from wallet.util.backtest import rebalance, rebalance_grid
+
+PRICES = cumprod(1 + default_rng(7).normal(0, .02, (500, 3)), axis=0) * [20, 50, 100]
+WEIGHTS = [.5, .3, .2]
+
+
+def _reference(prices, weights, interval, threshold, cost=0., cash=0., cash_rate=0.):
+    """ Day by day, the drift measured as the percentage of the portfolio value to trade. """
+    shares = [100 * (1 - cash) * w / p for w, p in zip(weights, prices[0])]
+    savings, equity, days, costs, last = 100 * cash, [], [], 0., 1 - interval
+    for i, row in enumerate(prices):
+        value = sum(s * p for s, p in zip(shares, row)) + savings
+        if i and i - last >= interval:
+            targets = [value * (1 - cash) * w / p for w, p in zip(weights, row)]
+            traded = sum(abs(t - s) * p for t, s, p in zip(targets, shares, row))
+            if traded / value * 100 / 2 >= threshold:
+                value -= traded * cost
+                costs += traded * cost
+                shares, savings, last = [value * (1 - cash) * w / p for w, p in zip(weights, row)], value * cash, i
+                days.append(i)
+        equity.append(value)
+        savings *= 1 + cash_rate
+    return equity, days, costs
+
+
+def test_matches_daily_simulation():
+    for kwargs in ({}, {'cost': .001}, {'cash': .1, 'cash_rate': .0001}):
+        for interval, threshold in ((1, 1), (15, 3), (60, 5)):
+            result = rebalance(PRICES, WEIGHTS, interval, threshold, **kwargs)
+            equity, days, costs = _reference(PRICES, WEIGHTS, interval, threshold, **kwargs)
+            assert result.days == days
+            assert allclose(result.equity, equity) and allclose(result.costs, costs)
+            assert len(result.trades) == len(days)
+
+
+def test_no_rebalance():
+    result = rebalance(PRICES, WEIGHTS, interval=0)
+    assert not result.days and allclose(result.equity, PRICES / PRICES[0] @ array(WEIGHTS) * 100)
+
+
+def test_chunked_scan(monkeypatch):
+    expected = {threshold: rebalance(PRICES, WEIGHTS, 15, threshold) for threshold in (3, 20)}
+    monkeypatch.setattr(backtest, 'CHUNK_DAYS', 7)
+    for threshold, result in expected.items():
+        chunked = rebalance(PRICES, WEIGHTS, 15, threshold)
+        assert chunked.days == result.days and allclose(chunked.equity, result.equity)
+
+
+def test_grid():
+    results = rebalance_grid(PRICES, WEIGHTS, (5, 15), (1, 3, 5))
+    assert list(results) == [(5, 1), (5, 3), (5, 5), (15, 1), (15, 3), (15, 5)]
+    assert results[15, 3].days == rebalance(PRICES, WEIGHTS, 15, 3).days
+    assert len(results[5, 1].days) >= len(results[5, 5].days)
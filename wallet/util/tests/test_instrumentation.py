@@ -0,0 +1,20 @@
+from time import perf_counter
+from types import SimpleNamespace
+
+from redis import RedisError
+
+from wallet.util.instrumentation import _after_cursor_execute
+
+
+class BrokenRedis:
+
+    def pipeline(self):
+        raise RedisError('unavailable')
+
+
+def test_slow_query_redis_down(context, monkeypatch, caplog):
+    monkeypatch.setitem(context.config, 'SLOW_QUERY_MS', 0)
+    monkeypatch.setattr(context, 'redis', BrokenRedis())
+    conn = SimpleNamespace(info={'query_started': [perf_counter()]})
+    _after_cursor_execute(conn, None, 'SELECT 1', {})
+    assert 'failed to record slow query' in caplog.text
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+
+from wallet.util.option_book import PositionBook
+
+TODAY = datetime.today()
+EXPIRIES = [(TODAY + timedelta(days=days)).strftime('%Y-%m-%d') for days in (7, 14)]
+
+
+def _position(symbol, expiry, strikes, options, quantity=1):
+    return {
+        'symbol': symbol, 'quantity': f'{quantity}.0000', 'strategy': 'short_put_spread', 'direction': 'credit',
+        'average_open_price': '100.00', 'chain': f'http://chains/{symbol}/',
+        'legs': [{'option': option, 'strike_price': f'{strike}.0000', 'expiration_date': expiry,
+                  'position_type': position_type}
+                 for option, strike, position_type in zip(options, strikes, ('long', 'short'))],
+    }
+
+
+def _data(mark, delta, gamma='0.0100', theta='-0.0200'):
+    return {'mark_price': mark, 'delta': delta, 'gamma': gamma, 'theta': theta}
+
+
+AGGREGATES = [
+    _position('AAPL', EXPIRIES[0], (100, 105), ['a1', 'a2'], 2),
+    _position('AAPL', EXPIRIES[1], (95, 100), ['a3', 'a4']),
+    _position('QQQ', EXPIRIES[0], (300, 310), ['q1', 'q2']),
+]
+MARKET_DATA = {
+    'a1': _data('1.00', '-0.2000'), 'a2': _data('2.00', '-0.4000', '0.0200'),
+    'a3': _data('0.50', '-0.1000'), 'a4': _data('1.00', '-0.2000'),
+    'q1': _data('3.00', '-0.3000'), 'q2': _data('6.00', '-0.5000'),
+}
+
+
+def test_positions_and_totals():
+    book = PositionBook(AGGREGATES, {'AAPL': 100., 'QQQ': 300.}, TODAY.strftime('%m/%d'))
+    assert book.update(MARKET_DATA).tolist() == [0, 1, 2]
+    (_, first), (_, second), (symbol, third) = book.positions()
+    assert symbol == 'QQQ'
+    assert first.gain == 2 * 100 * (1 - 2) + 200 and first.maximum == 1000 and first.health == 80
+    assert first.shares == 40. and first.gamma == -2. and first.theta == 0.
+    totals = book.totals('symbol')
+    assert totals['AAPL'].gain == first.gain + second.gain
+    assert totals['AAPL'].shares == first.shares + second.shares
+    assert totals['QQQ'].value == abs(third.shares) * 300
+    by_expiry = book.totals('expiry')
+    assert by_expiry[first.expiry].maximum == first.maximum + third.maximum
+
+    shock = book.shock(10)
+    assert shock['AAPL'].shares == round(totals['AAPL'].shares + 10 * totals['AAPL'].gamma, 1)
+    assert book.shock(0)['QQQ'] == (totals['QQQ'].shares, totals['QQQ'].gain)
+
+
+def test_incremental_update():
+    book = PositionBook(AGGREGATES, {'AAPL': 100., 'QQQ': 300.}, TODAY.strftime('%m/%d'))
+    book.update(MARKET_DATA)
+    before = book.positions()
+    assert book.update(MARKET_DATA).tolist() == []
+    assert book.update({**MARKET_DATA, 'q2': _data('5.00', '-0.5000')}).tolist() == [2]
+    after = book.positions()
+    assert after[:2] == before[:2] and after[2][1].gain == before[2][1].gain + 100
+    assert book.update({**MARKET_DATA, 'q2': _data('5.00', '-0.5000')}, {'AAPL': 101., 'QQQ': 300.}).tolist() == [0, 1]
+
+
+def test_first_update_computes_all():
+    empty = {field: None for field in ('mark_price', 'delta', 'gamma', 'theta')}
+    book = PositionBook(AGGREGATES, {'AAPL': 100., 'QQQ': 300.}, TODAY.strftime('%m/%d'))
+    assert book.update({**MARKET_DATA, 'q1': empty, 'q2': empty}).tolist() == [0, 1, 2]
+    (_, position), = book.positions()[2:]
+    assert position.gain == 100 and position.health == 100 and position.shares == 0.
+
+
+def test_same_positions():
+    today = TODAY.strftime('%m/%d')
+    book = PositionBook(AGGREGATES, {'AAPL': 100., 'QQQ': 300.}, today)
+    assert book.same_positions(PositionBook(AGGREGATES, {'AAPL': 101., 'QQQ': 300.}, today))
+    assert not book.same_positions(PositionBook(AGGREGATES[:2], {'AAPL': 100.}, today))
+    changed = [*AGGREGATES[:2], _position('QQQ', EXPIRIES[0], (300, 310), ['q1', 'q2'], 2)]
+    assert not book.same_positions(PositionBook(changed, {'AAPL': 100., 'QQQ': 300.}, today))
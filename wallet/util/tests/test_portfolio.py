@@ -0,0 +1,52 @@
+from itertools import product
+
+from numpy import allclose, array, isclose
+from pytest import warns
+from scipy import optimize
+from scipy.optimize import OptimizeResult
+from scipy.linalg import pinv
+
+from wallet.util.benchmark_optimize import RISK_FREE_RATE_PER_DAY, returns, search_portfolio
+from wallet.util.portfolio import frontier_portfolio, long_only_portfolio
+
+
+def test_matches_search():
+    for size, sharpe in product((5, 30), (True, False)):
+        data = returns(size, seed=size)
+        mean, cov = data.mean().values, data.cov().values
+        weights, ratio = frontier_portfolio(mean, cov, pinv(cov), RISK_FREE_RATE_PER_DAY, sharpe)
+        searched_weights, searched = search_portfolio(data, RISK_FREE_RATE_PER_DAY, sharpe)
+        assert ratio >= searched - 1e-6
+        assert allclose(weights, searched_weights.values, atol=1e-2)
+
+
+def test_short_direction():
+    data = returns(30)
+    mean, cov = data.mean().values, data.cov().values
+    for sharpe, direction in ((True, pinv(cov) @ (mean - RISK_FREE_RATE_PER_DAY)), (False, pinv(cov).sum(axis=1))):
+        weights, _ = frontier_portfolio(mean, cov, pinv(cov), RISK_FREE_RATE_PER_DAY, sharpe, allow_short=True)
+        assert isclose(weights[weights > 0].sum(), 1)
+        assert allclose(weights, direction / direction[direction > 0].sum())
+
+
+def test_long_only():
+    data = returns(8)
+    mean, cov = data.mean().values, data.cov().values
+    for sharpe in (True, False):
+        weights, ratio = long_only_portfolio(mean, cov, RISK_FREE_RATE_PER_DAY, sharpe)
+        assert (weights >= 0).all() and isclose(weights.sum(), 1)
+        for other in (array([1.] + [0.] * 7), array([1 / 8] * 8)):
+            deviation = (other @ cov @ other) ** .5
+            assert ratio >= ((other @ mean - RISK_FREE_RATE_PER_DAY) / deviation if sharpe else 1 / deviation) - 1e-6
+
+
+def test_long_only_not_converged(monkeypatch):
+    data = returns(8)
+    mean, cov = data.mean().values, data.cov().values
+    last = array([.5, -.1, .3, 0, 0, .2, 0, .1])
+    monkeypatch.setattr(optimize, 'minimize', lambda *_, **__: OptimizeResult(
+        x=last, success=False, message='Iteration limit reached'))
+    with warns(UserWarning, match='not converged'):
+        weights, ratio = long_only_portfolio(mean, cov, RISK_FREE_RATE_PER_DAY, sharpe=False)
+    assert (weights >= 0).all() and isclose(weights.sum(), 1)
+    assert ratio >= 1 / (array([1 / 8] * 8) @ cov @ array([1 / 8] * 8)) ** .5 - 1e-9
@@ -0,0 +1,46 @@
+from datetime import date
+
+from pandas import DataFrame, bdate_range
+
+from wallet.util.price_store import PriceStore, offline
+
+DAYS = bdate_range('2021-01-04', '2021-03-31')
+PRICES = DataFrame({'SPY': [300. + i for i in range(len(DAYS))], 'TMF': [30. - i / 10 for i in range(len(DAYS))]},
+                   index=DAYS)
+
+
+def _recording(frame, calls):
+    source = offline(frame)
+
+    def fetch(symbols, start, end):
+        calls.append((tuple(symbols), start, end))
+        return source(symbols, start, end)
+
+    return fetch
+
+
+def test_top_up_only_missing_days(tmp_path):
+    calls = []
+    store = PriceStore(str(tmp_path), _recording(PRICES, calls))
+    frame = store.load(['SPY', 'TMF'], date(2021, 2, 1), date(2021, 2, 26))
+    assert frame.equals(PRICES['2021-02-01':'2021-02-26'])
+    assert calls == [(('SPY', 'TMF'), date(2021, 2, 1), date(2021, 2, 26))]
+
+    assert store.load(['SPY'], date(2021, 2, 8), date(2021, 2, 19)).equals(PRICES[['SPY']]['2021-02-08':'2021-02-19'])
+    assert len(calls) == 1
+
+    store = PriceStore(str(tmp_path), _recording(PRICES, calls))  # the coverage survives a restart
+    frame = store.load(['SPY', 'TMF'], date(2021, 1, 15), date(2021, 3, 12))
+    assert frame.equals(PRICES['2021-01-15':'2021-03-12'])
+    assert calls[1:] == [(('SPY', 'TMF'), date(2021, 1, 15), date(2021, 2, 1)),
+                         (('SPY', 'TMF'), date(2021, 2, 26), date(2021, 3, 12))]
+
+
+def test_adjusted_history_rescaled(tmp_path):
+    store = PriceStore(str(tmp_path), offline(PRICES))
+    store.load(['TMF'], date(2021, 1, 4), date(2021, 2, 26))
+    adjusted = PRICES.copy()
+    adjusted.loc[:'2021-03-05', 'TMF'] *= .9  # a dividend paid on 03/08 scales the closes before it
+    store.source = offline(adjusted)
+    frame = store.load(['TMF'], date(2021, 1, 4), date(2021, 3, 31))
+    assert (frame['TMF'] - adjusted['TMF']).abs().max() < 1e-9
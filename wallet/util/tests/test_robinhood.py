@@ -0,0 +1,143 @@
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps
+from threading import Thread
+from urllib.parse import parse_qs, urlparse
+
+from pytest import fixture
+from requests import Session
+
+from wallet.util import robinhood
+
+EXPIRY = (datetime.today() + timedelta(days=7)).strftime('%Y-%m-%d')
+OPTIONS = {f'http://options/{i}/': {'mark_price': f'{i}.00', 'delta': f'-0.{i}', 'gamma': '0.01', 'theta': '-0.02'}
+           for i in range(1, 5)}
+
+CHAIN = {f'http://chain/{strike}/': {'strike_price': f'{strike:.4f}', 'mark_price': f'{max(.05, strike - 95) / 2:.2f}',
+                                     'delta': f'{-min(.95, max(.05, (strike - 80) / 40)):.4f}',
+                                     'gamma': f'{.05 - abs(strike - 100) / 1000:.4f}', 'theta': f'{-strike / 5000:.4f}'}
+         for strike in (75 + 2.5 * i for i in range(21))}
+CHAIN['http://chain/70.0/'] = {'strike_price': '70.0000', 'mark_price': '0.01', 'delta': None, 'gamma': None,
+                               'theta': None}  # too far from the money to have greeks
+
+
+def _position(symbol, strikes, options):
+    return {
+        'symbol': symbol, 'quantity': '2.0000', 'strategy': 'short_put_spread', 'direction': 'credit',
+        'average_open_price': '50.00', 'chain': f'http://chains/{symbol}/',
+        'legs': [{'option': option, 'strike_price': f'{strike}.0000', 'expiration_date': EXPIRY,
+                  'position_type': position_type}
+                 for option, strike, position_type in zip(options, strikes, ('long', 'short'))],
+    }
+
+
+ROUTES = {
+    '/options/aggregate_positions/': lambda _: {'next': None, 'results': [
+        _position('AAPL', (100, 105), list(OPTIONS)[:2]),
+        _position('QQQ', (300, 305), list(OPTIONS)[2:]),
+        {**_position('SPY', (400, 405), list(OPTIONS)[:2]), 'quantity': '0.0000'},
+    ]},
+    '/marketdata/quotes/': lambda query: {'results': [
+        {'symbol': symbol, 'last_trade_price': '110.00'} for symbol in query['symbols'][0].split(',')
+    ]},
+    '/marketdata/options/': lambda query: {'results': [
+        {**OPTIONS, **CHAIN}[option] for option in query['instruments'][0].split(',')
+    ]},
+    '/options/instruments/': lambda query: {'next': None, 'results': [
+        {'url': url, 'strike_price': data['strike_price'], 'expiration_date': expiry}
+        for expiry in query['expiration_dates'][0].split(',') for url, data in CHAIN.items()
+    ]},
+    '/instruments/': lambda query: {'results': [{'tradable_chain_id': f'chain-{query["symbol"][0]}'}]},
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        self.requests.append((url.path, query))
+        body = dumps(ROUTES[url.path](query)).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):
+        pass
+
+
+@fixture
+def stub(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(robinhood, 'HOST', f'http://127.0.0.1:{server.server_port}')
+    StubHandler.requests = []
+    yield StubHandler.requests
+    server.shutdown()
+
+
+def test_option_positions(stub):
+    positions = robinhood.get_option_positions(Session(), ['ARKK'])
+    assert sorted(positions) == ['AAPL', 'ARKK', 'QQQ']
+    assert positions['ARKK'].chain == 'chain-ARKK'
+    assert all(item.price == 110 for item in positions.values())
+    aapl, = positions['AAPL'].positions
+    assert aapl.maximum == 1000 and aapl.gain == 2 * 100 * (1 - 2) + 100
+    assert aapl.shares == round((-.1 + .2) * 100 * 2, 1)
+
+    paths = [path for path, _ in stub]
+    assert paths.count('/marketdata/quotes/') == 1
+    market_data = [query for path, query in stub if path == '/marketdata/options/']
+    assert len(market_data) == 11  # one request per sampling round, for all the legs
+    assert all(len(query['instruments'][0].split(',')) == len(OPTIONS) for query in market_data)
+
+
+def test_market_data_batches(stub, monkeypatch):
+    monkeypatch.setattr(robinhood, 'MAX_INSTRUMENTS', 3)
+    options = list(OPTIONS)
+    market_data = robinhood._get_options_market_data(Session(), options)
+    assert market_data == [OPTIONS[option] for option in options]
+    assert len(stub) == 11 * 2
+
+
+def test_option_spreads(stub):
+    spreads = robinhood.find_option_spreads(Session(), 'short_put', 'chain', EXPIRY, 100, .4, [5, 10], window=None)
+    assert spreads == _reference_spreads(100, .4, [5, 10])
+    assert spreads and all(spread.expiry == EXPIRY for spread in spreads)
+
+    other = (datetime.today() + timedelta(days=14)).strftime('%Y-%m-%d')
+    scanned = robinhood.scan_option_spreads(Session(), 'short_put', {'AAPL': ('a', 100), 'QQQ': ('q', 100)},
+                                            [EXPIRY, other], .4, [5, 10], window=None)
+    assert sorted(scanned) == ['AAPL', 'QQQ']
+    assert [s for s in scanned['AAPL'] if s.expiry == EXPIRY] == spreads
+    assert {s.expiry for s in scanned['QQQ']} == {EXPIRY, other}
+    assert robinhood.scan_option_spreads(Session(), 'short_put', {}, EXPIRY, .4, [5]) == {}
+
+
+def _reference_spreads(stock_price, ratio1, intervals):
+    """ The short put spreads, pair by pair. """
+    options = sorted(((float(d['strike_price']), float(d['mark_price']), float(d['delta']),
+                       float(d['gamma']), float(d['theta'])) for d in CHAIN.values() if d['delta']), reverse=True)
+    spreads = []
+    for i in range(len(options)):
+        if -options[i][2] > 1 - ratio1 or options[i][0] % 5 != 0:
+            continue
+        for j in range(i + 1, len(options)):
+            price = round(options[j][1] - options[i][1], 2)
+            maximum = round(abs(options[j][0] - options[i][0]), 2)
+            if maximum not in intervals:
+                continue
+            spreads.append(robinhood.Spread(
+                f'{options[j][0]}/{options[i][0]} Puts Credit Spread',
+                round((options[j][2] - options[i][2]) * 100, 1), price, maximum, round((1 + price / maximum) * 100),
+                round((options[j][3] - options[i][3]) * stock_price, 2),
+                round((options[j][4] - options[i][4]) * 100, 2), EXPIRY))
+    spreads.sort(key=lambda c: (c.maximum, c.health))
+    result = []
+    for spread in spreads:
+        if len(result) < 5 or result[-5].maximum != spread.maximum:
+            result.append(spread)
+    return result
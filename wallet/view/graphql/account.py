@@ -1,12 +1,9 @@
-from collections import defaultdict
-
-from flask import g
 from flask_login import current_user
 from graphene import Float, Int, List, ObjectType, String
 
 from wallet.model.account import Account as AccountModel
-from wallet.model.entry import Entry as EntryModel
 from wallet.view.graphql.entry import Entry
+from wallet.view.graphql.loader import loaders
 
 
 class Account(ObjectType):
@@ -24,13 +21,8 @@ class Account(ObjectType):
 
     @staticmethod
     def resolve_active_entries(parent, _):
-        if 'active_entries' not in g:
-            entries = defaultdict(list)
-            for entry in EntryModel.get_list(current_user):
-                entries[entry.account].append(entry)
-            g.active_entries = entries
-        return g.active_entries[parent]
+        return loaders().active_entries.load(parent.id)
 
     @staticmethod
     def get_list():
-        return AccountModel.get_list(current_user)
+        return loaders().account.prime_all(AccountModel.get_list(current_user))
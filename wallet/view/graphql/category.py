@@ -1,7 +1,11 @@
+from datetime import date, timedelta
+
 from flask_login import current_user
-from graphene import Int, ObjectType, String
+from graphene import Date, Field, Float, Int, ObjectType, String
 
 from wallet.model.category import Category as CategoryModel
+from wallet.model.spending import CategorySpending
+from wallet.view.graphql.loader import loaders
 
 
 class Category(ObjectType):
@@ -10,4 +14,29 @@ class Category(ObjectType):
 
     @staticmethod
     def get_list():
-        return CategoryModel.get_list(current_user)
+        return loaders().category.prime_all(CategoryModel.get_list(current_user))
+
+
+class Spending(ObjectType):
+    category = Field(Category)
+    month = Date()
+    currency = Int()
+    currency_symbol = String()
+    amount = Float()
+    count = Int()
+
+    @staticmethod
+    def resolve_category(parent, _):
+        return loaders().category.load(parent.category_id) if parent.category_id else None
+
+    @staticmethod
+    def resolve_currency_symbol(parent, _):
+        return parent.currency.symbol
+
+    @staticmethod
+    def get_list(since, until, group_by):
+        until = until or date.today()
+        since = since or until - timedelta(days=365)
+        if since > until:
+            raise ValueError('开始日期不能晚于结束日期')
+        return CategorySpending.get_list(current_user, since, until, group_by)
@@ -1,4 +1,9 @@
-from graphene import Float, Int, ObjectType, String
+from flask_login import current_user
+from graphene import Field, Float, Int, ObjectType, String, relay
+
+from wallet.model.entry import Entry as EntryModel
+from wallet.view.graphql.loader import loaders
+from wallet.view.graphql.pagination import connection, decode_cursor, page_size, utc
 
 
 class Entry(ObjectType):
@@ -7,7 +12,29 @@ class Entry(ObjectType):
     amount = Float()
     currency = Int()
     currency_symbol = String()
+    account = Field('wallet.view.graphql.account.Account')
+    transaction = Field('wallet.view.graphql.transaction.Transaction')
 
     @staticmethod
     def resolve_currency_symbol(parent, _):
         return parent.currency.symbol
+
+    @staticmethod
+    def resolve_account(parent, _):
+        return loaders().account.load(parent.account_id)
+
+    @staticmethod
+    def resolve_transaction(parent, _):
+        return loaders().transaction.load(parent.transaction_id) if parent.transaction_id else None
+
+    @staticmethod
+    def get_page(first, after=None, account=None, since=None, until=None):
+        entries, has_next = EntryModel.get_page(current_user, page_size(first), decode_cursor(after),
+                                                account, utc(since), utc(until))
+        return connection(EntryConnection, loaders().entry.prime_all(entries), has_next,
+                          lambda e: (e.created, e.id))
+
+
+class EntryConnection(relay.Connection):
+    class Meta:
+        node = Entry
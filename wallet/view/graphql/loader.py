@@ -0,0 +1,59 @@
+from collections import defaultdict
+
+from flask import g
+from flask_login import current_user
+from promise import Promise
+from promise.dataloader import DataLoader
+
+from wallet.core import db
+from wallet.model.account import Account
+from wallet.model.category import Category
+from wallet.model.entry import Entry
+from wallet.model.transaction import Transaction
+
+
+class QueryLoader(DataLoader):
+    """ Coalesces the keys requested while resolving into one query per batch. """
+
+    def __init__(self, fetch, key, many=False):
+        super().__init__()
+        self.fetch, self.key, self.many = fetch, key, many
+
+    def batch_load_fn(self, keys):
+        if self.many:
+            result = defaultdict(list)
+            for item in self.fetch(keys):
+                result[getattr(item, self.key)].append(item)
+            return Promise.resolve([result[key] for key in keys])
+        result = {getattr(item, self.key): item for item in self.fetch(keys)}
+        return Promise.resolve([result.get(key) for key in keys])
+
+    def prime_all(self, items):
+        for item in items:
+            self.prime(getattr(item, self.key), item)
+        return items
+
+
+class Loaders:
+    def __init__(self, user):
+        self.account = QueryLoader(
+            lambda ids: Account.query.filter_by(user=user).filter(Account.id.in_(ids)).with_balance(), 'id')
+        self.category = QueryLoader(
+            lambda ids: Category.query.filter_by(user=user).filter(Category.id.in_(ids)), 'id')
+        self.transaction = QueryLoader(
+            lambda ids: Transaction.query.filter_by(user=user).filter(Transaction.id.in_(ids)), 'id')
+        self.entry = QueryLoader(
+            lambda ids: (Entry.query.of(user).filter(Entry.id.in_(ids))
+                         .options(db.contains_eager(Entry.account))), 'id')
+        self.active_entries = QueryLoader(
+            lambda ids: (Entry.query.active_of(user).filter(Entry.account_id.in_(ids))
+                         .options(db.contains_eager(Entry.account)).order_by(Entry.created)), 'account_id', True)
+        self.transaction_entries = QueryLoader(
+            lambda ids: (Entry.query.of(user).filter(Entry.transaction_id.in_(ids))
+                         .options(db.contains_eager(Entry.account)).order_by(Entry.id)), 'transaction_id', True)
+
+
+def loaders():
+    if 'loaders' not in g:
+        g.loaders = Loaders(current_user)
+    return g.loaders
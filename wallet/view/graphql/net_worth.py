@@ -0,0 +1,21 @@
+from datetime import datetime, timedelta
+
+from flask_login import current_user
+from graphene import Date, Float, ObjectType
+
+from wallet.model.net_worth import BalanceHistory
+
+
+class NetWorth(ObjectType):
+    date = Date()
+    usd = Float()
+    rmb = Float()
+    total_usd = Float()
+
+    @staticmethod
+    def get_list(since, until, granularity):
+        until = until or datetime.utcnow().date()  # days of BalanceHistory are UTC ones
+        since = since or until - timedelta(days=365)
+        if since > until:
+            raise ValueError('开始日期不能晚于结束日期')
+        return BalanceHistory.net_worth(current_user, since, until, granularity)
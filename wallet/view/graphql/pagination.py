@@ -0,0 +1,53 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime, timezone
+
+from graphene import DateTime, Int, String
+from graphene.relay import PageInfo
+
+MAX_PAGE_SIZE = 100
+
+
+def page_arguments(**kwargs):
+    return {
+        'first': Int(default_value=20),
+        'after': String(),
+        'since': DateTime(),
+        'until': DateTime(),
+        **kwargs,
+    }
+
+
+def encode_cursor(moment, id_):
+    return urlsafe_b64encode(f'{moment.isoformat()}|{id_}'.encode()).decode()
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        moment, id_ = urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(moment), int(id_)
+    except ValueError:
+        raise ValueError('无效的游标')
+
+
+def page_size(first):
+    if not 0 < first <= MAX_PAGE_SIZE:
+        raise ValueError(f'分页大小必须在1到{MAX_PAGE_SIZE}之间')
+    return first
+
+
+def utc(moment):
+    if moment and moment.tzinfo:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def connection(connection_type, items, has_next, key):
+    edges = [connection_type.Edge(node=item, cursor=encode_cursor(*key(item))) for item in items]
+    return connection_type(edges=edges, page_info=PageInfo(
+        has_next_page=has_next,
+        has_previous_page=False,
+        start_cursor=edges[0].cursor if edges else None,
+        end_cursor=edges[-1].cursor if edges else None,
+    ))
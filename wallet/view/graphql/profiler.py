@@ -0,0 +1,150 @@
+from bisect import bisect_left
+from collections import defaultdict
+from cProfile import Profile
+from datetime import datetime, timedelta
+from io import StringIO
+from pstats import Stats
+from random import random
+from time import perf_counter
+
+from click import echo, option
+from flask import current_app, g, request
+from flask.json import dumps, loads
+from promise import Promise, is_thenable
+
+from wallet.util.instrumentation import operation_name
+
+STATS_KEY = 'graphql-stats:{:%Y%m%d%H}'
+PROFILES_KEY = 'graphql-stats:profiles'
+STATS_HOURS = 24
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class ResolverProfiler:
+    """ Graphene middleware timing every resolver by parent type and field, until its promise settles. """
+
+    def resolve(self, next_, root, info, **args):
+        timings = g.get('resolver_timings')
+        if timings is None:
+            return next_(root, info, **args)
+        field = f'{info.parent_type.name}.{info.field_name}'
+        started = perf_counter()
+        result = next_(root, info, **args)
+        if is_thenable(result):
+            def done(value):
+                timings[field].append(perf_counter() - started)
+                return value
+
+            return Promise.resolve(result).then(done)
+        timings[field].append(perf_counter() - started)
+        return result
+
+
+def init_app(app):
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+    @app.cli.command()
+    @option('--hours', default=STATS_HOURS, help='How many hours to look back.')
+    def graphql_stats(hours):
+        """ GraphQL Resolver Latencies """
+        echo(f'{"field":40} {"count":>8} {"avg":>8} {"p50":>6} {"p95":>6} {"p99":>6}')
+        for field, stats in resolver_stats(hours).items():
+            echo(f'{field:40} {stats["count"]:8} {stats["avg_ms"]:8.1f} '
+                 f'{stats["p50"]:>6} {stats["p95"]:>6} {stats["p99"]:>6}')
+        for profile in current_app.redis.lrange(PROFILES_KEY, 0, 2):
+            profile = loads(profile)
+            echo(f'\n{profile["time"]} {profile["name"]} {profile["ms"]}ms\n{profile["stats"]}')
+
+
+def resolver_stats(hours=STATS_HOURS):
+    """ Latency histogram of each resolver over the last hours, as percentiles in bucket upper bounds (ms). """
+    now = datetime.utcnow()
+    pipeline = current_app.redis.pipeline()
+    for i in range(hours):
+        pipeline.hgetall(STATS_KEY.format(now - timedelta(hours=i)))
+    histograms = defaultdict(lambda: defaultdict(int))
+    totals = defaultdict(float)
+    for stats in pipeline.execute():
+        for key, value in stats.items():
+            field, bucket = key.decode().rsplit(':', 1)
+            if bucket == 'sum_ms':
+                totals[field] += float(value)
+            else:
+                histograms[field][bucket] += int(value)
+    result = {}
+    for field, histogram in histograms.items():
+        count = sum(histogram.values())
+        result[field] = {
+            'count': count,
+            'total_ms': round(totals[field], 1),
+            'avg_ms': round(totals[field] / count, 2),
+            **{f'p{q}': _percentile(histogram, count, q) for q in (50, 95, 99)},
+        }
+    return dict(sorted(result.items(), key=lambda item: -item[1]['total_ms']))
+
+
+def profiles():
+    return [loads(profile) for profile in current_app.redis.lrange(PROFILES_KEY, 0, -1)]
+
+
+def _percentile(histogram, count, q):
+    seen = 0
+    for bucket in [*map(str, BUCKETS_MS), 'inf']:
+        seen += histogram.get(bucket, 0)
+        if seen * 100 >= count * q:
+            return bucket
+    return 'inf'
+
+
+def _bucket(ms):
+    i = bisect_left(BUCKETS_MS, ms)
+    return str(BUCKETS_MS[i]) if i < len(BUCKETS_MS) else 'inf'
+
+
+def _before_request():
+    if request.endpoint != 'graphql':
+        return
+    g.resolver_timings = defaultdict(list)
+    g.graphql_started = perf_counter()
+    if random() < current_app.config['GRAPHQL_PROFILE_RATE']:
+        g.graphql_profile = Profile()
+        g.graphql_profile.enable()
+
+
+def _after_request(response):
+    timings = g.pop('resolver_timings', None)
+    if timings is None:
+        return response
+    elapsed_ms = (perf_counter() - g.pop('graphql_started')) * 1000
+    profile = g.pop('graphql_profile', None)
+    try:
+        if profile:
+            profile.disable()
+            if elapsed_ms >= current_app.config['GRAPHQL_SLOW_MS']:
+                _save_profile(profile, elapsed_ms)
+        _record(timings)
+    except Exception as e:  # never fail the request for its statistics
+        current_app.logger.warning(f'failed to record resolver stats: {e!r}')
+    return response
+
+
+def _record(timings):
+    key = STATS_KEY.format(datetime.utcnow())
+    pipeline = current_app.redis.pipeline()
+    for field, durations in timings.items():
+        for ms in (seconds * 1000 for seconds in durations):
+            pipeline.hincrby(key, f'{field}:{_bucket(ms)}', 1)
+        pipeline.hincrbyfloat(key, f'{field}:sum_ms', sum(durations) * 1000)
+    pipeline.expire(key, 3600 * (STATS_HOURS + 1))
+    pipeline.execute()
+
+
+def _save_profile(profile, elapsed_ms):
+    output = StringIO()
+    Stats(profile, stream=output).sort_stats('cumulative').print_stats(30)
+    current_app.redis.lpush(PROFILES_KEY, dumps({
+        'time': datetime.utcnow().isoformat(timespec='seconds'), 'name': operation_name(),
+        'ms': round(elapsed_ms, 1), 'stats': output.getvalue(),
+    }))
+    current_app.redis.ltrim(PROFILES_KEY, 0, 19)
@@ -1,20 +1,30 @@
 from flask_login import current_user
-from graphene import Int, List, ObjectType, Schema, String
+from graphene import Date, Field, Int, List, ObjectType, Schema, String
 
 from wallet.model.config import Config
 from wallet.model.m1 import M1Portfolio
 from wallet.view.graphql.account import Account
-from wallet.view.graphql.category import Category
+from wallet.view.graphql.category import Category, Spending
 from wallet.view.graphql.config import AddTransactionTemplate, DelTransactionTemplate
-from wallet.view.graphql.transaction import AddTransaction
+from wallet.view.graphql.entry import Entry, EntryConnection
+from wallet.view.graphql.net_worth import NetWorth
+from wallet.view.graphql.pagination import page_arguments
+from wallet.view.graphql.transaction import AddTransaction, AddTransactions, Transaction, TransactionConnection
 
 
 class Query(ObjectType):
     health_check = String()
     accounts = List(Account)
     categories = List(Category)
+    entries = Field(EntryConnection, **page_arguments(account=Int()))
+    transactions = Field(TransactionConnection, **page_arguments(account=Int(), category=Int()))
     transaction_templates = String()
-    m1 = List(String, name=String(default_value='Individual'), limit=Int(default_value=20))
+    spending = List(Spending, since=Date(name='from'), until=Date(name='to'),
+                    group_by=String(default_value='category'))
+    net_worth = List(NetWorth, since=Date(name='from'), until=Date(name='to'),
+                     granularity=String(default_value='day'))
+    m1 = List(String, name=String(default_value='Individual'), limit=Int(default_value=20),
+              since=Date(), until=Date())
 
     @staticmethod
     def resolve_health_check(*_):
@@ -28,18 +38,35 @@ class Query(ObjectType):
     def resolve_categories(*_):
         return Category.get_list()
 
+    @staticmethod
+    def resolve_entries(*_, **kwargs):
+        return Entry.get_page(**kwargs)
+
+    @staticmethod
+    def resolve_transactions(*_, **kwargs):
+        return Transaction.get_page(**kwargs)
+
     @staticmethod
     def resolve_transaction_templates(*_):
         return Config.get_transaction_templates(current_user)
 
     @staticmethod
-    def resolve_m1(*_, name, limit):
+    def resolve_spending(*_, group_by, since=None, until=None):
+        return Spending.get_list(since, until, group_by)
+
+    @staticmethod
+    def resolve_net_worth(*_, granularity, since=None, until=None):
+        return NetWorth.get_list(since, until, granularity)
+
+    @staticmethod
+    def resolve_m1(*_, name, limit, since=None, until=None):
         return [f'{e.date}: {e.value:.2f} - {e.gain:+7.2f} ({e.rate:+.2f}%)'
-                for e in M1Portfolio.net_value_series(name, limit)]
+                for e in M1Portfolio.net_value_series(name, limit, since, until)]
 
 
 class Mutation(ObjectType):
     add_transaction = AddTransaction.Field()
+    add_transactions = AddTransactions.Field()
     add_transaction_template = AddTransactionTemplate.Field()
     del_transaction_template = DelTransactionTemplate.Field()
 
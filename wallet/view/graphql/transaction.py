@@ -1,13 +1,55 @@
 from flask import current_app
 from flask_login import current_user
-from graphene import Boolean, DateTime, Float, InputObjectType, Int, List, Mutation, String
+from graphene import Boolean, DateTime, Field, Float, InputObjectType, Int, List, Mutation, ObjectType, String, relay
 
 from wallet.core import db
 from wallet.model.account import Account as AccountModel, AccountType
 from wallet.model.category import Category as CategoryModel
 from wallet.model.entry import Entry as EntryModel
+from wallet.model.spending import CategorySpending
 from wallet.model.enums import Currency, Timezone
 from wallet.model.transaction import Transaction as TransactionModel
+from wallet.view.graphql.category import Category
+from wallet.view.graphql.entry import Entry
+from wallet.view.graphql.loader import loaders
+from wallet.view.graphql.pagination import connection, decode_cursor, page_size, utc
+
+MAX_BATCH_SIZE = 100
+
+
+class Transaction(ObjectType):
+    id = Int()
+    name = String()
+    amount = Float()
+    currency = Int()
+    currency_symbol = String()
+    occurred = DateTime()
+    category = Field(Category)
+    entries = List(Entry)
+
+    @staticmethod
+    def resolve_currency_symbol(parent, _):
+        return parent.currency.symbol
+
+    @staticmethod
+    def resolve_category(parent, _):
+        return loaders().category.load(parent.category_id)
+
+    @staticmethod
+    def resolve_entries(parent, _):
+        return loaders().transaction_entries.load(parent.id)
+
+    @staticmethod
+    def get_page(first, after=None, category=None, account=None, since=None, until=None):
+        txns, has_next = TransactionModel.get_page(current_user, page_size(first), decode_cursor(after),
+                                                   category, account, utc(since), utc(until))
+        return connection(TransactionConnection, loaders().transaction.prime_all(txns), has_next,
+                          lambda t: (t.occurred_utc, t.id))
+
+
+class TransactionConnection(relay.Connection):
+    class Meta:
+        node = Transaction
 
 
 class EntryInput(InputObjectType):
@@ -27,6 +69,12 @@ class TransactionInput(InputObjectType):
     items = List(EntryInput, required=True)
 
 
+class TransactionResult(ObjectType):
+    ok = Boolean()
+    id = Int()
+    error = String()
+
+
 class AddTransaction(Mutation):
     class Arguments:
         input = TransactionInput(required=True)
@@ -35,31 +83,93 @@ class AddTransaction(Mutation):
 
     @staticmethod
     def mutate(*_, input):
-        description, category, time, timezone, items = _validate_input(input)
-        txn = TransactionModel.create(current_user, description, category, time, timezone)
-        for account, amount, currency, name, merge_entry in items:
-            txn.add_entry(account, amount, currency, name=name, auto_merge=merge_entry)
-        txn.finish()
+        txn = _create(*_validate_input(input, _References([input])))
+        CategorySpending.add(txn)
         db.session.commit()
-        current_app.logger.info(f'transaction created: {txn}')
-        for i, entry in enumerate(txn.entries):
-            current_app.logger.info(f'associated entry{i + 1}: {entry}')
+        _log(txn)
         return AddTransaction(ok=True)
 
 
-def _validate_input(input):
+class AddTransactions(Mutation):
+    class Arguments:
+        inputs = List(TransactionInput, required=True)
+
+    ok = Boolean()
+    results = List(TransactionResult)
+
+    @staticmethod
+    def mutate(*_, inputs):
+        if not 0 < len(inputs) <= MAX_BATCH_SIZE:
+            raise ValueError(f'每次添加的交易数必须在1到{MAX_BATCH_SIZE}之间')
+        references = _References(inputs)
+        outcomes = []
+        for input in inputs:
+            savepoint = db.session.begin_nested()  # a failed item leaves no entries or balance changes behind
+            try:
+                outcomes.append(_create(*_validate_input(input, references)))
+                savepoint.commit()
+            except (AssertionError, ValueError) as e:
+                savepoint.rollback()
+                outcomes.append(str(e) or '交易不成立')
+        txns = [txn for txn in outcomes if isinstance(txn, TransactionModel)]
+        CategorySpending.add(*txns)
+        db.session.flush()
+        results = [TransactionResult(ok=True, id=txn.id) if isinstance(txn, TransactionModel)
+                   else TransactionResult(ok=False, error=txn)
+                   for txn in outcomes]
+        db.session.commit()
+        for txn in txns:
+            _log(txn)
+        return AddTransactions(ok=len(txns) == len(inputs), results=results)
+
+
+class _References:
+    """ Categories, accounts and merge entries referred to by the inputs, loaded with one query each. """
+
+    def __init__(self, inputs):
+        items = [item for input in inputs for item in input.items]
+        self.categories = _by_id(CategoryModel.query.filter_by(user=current_user)
+                                 .filter(CategoryModel.id.in_({input.category for input in inputs})))
+        self.accounts = _by_id(AccountModel.query.filter_by(user=current_user)
+                               .filter(AccountModel.id.in_({item.account for item in items}))
+                               .options(db.selectinload(AccountModel.balances)))
+        merge_entries = {item.merge_entry for item in items if item.merge_entry}
+        self.entries = _by_id(EntryModel.query.of(current_user)
+                              .filter(EntryModel.id.in_(merge_entries))
+                              .options(db.contains_eager(EntryModel.account))) if merge_entries else {}
+
+
+def _by_id(query):
+    return {model.id: model for model in query}
+
+
+def _create(description, category, time, timezone, items):
+    txn = TransactionModel.create(current_user, description, category, time, timezone)
+    for account, amount, currency, name, merge_entry in items:
+        txn.add_entry(account, amount, currency, name=name, auto_merge=merge_entry)
+    txn.finish()
+    return txn
+
+
+def _log(txn):
+    current_app.logger.info(f'transaction created: {txn}')
+    for i, entry in enumerate(txn.entries):
+        current_app.logger.info(f'associated entry{i + 1}: {entry}')
+
+
+def _validate_input(input, references):
     description = input.description.strip()
     if not description:
         raise ValueError('必填：说明')
-    category = CategoryModel.query.get(input.category)
-    if category.user_id != current_user.id:
+    category = references.categories.get(input.category)
+    if not category:
         raise ValueError('必填：分类')
     time = input.time.replace(tzinfo=None)  # UTC time assumed
     timezone = Timezone.US if input.timezoneUS else Timezone.CN
     items = []
     for item in input.items:
-        account = AccountModel.query.get(item.account)
-        if account.user_id != current_user.id:
+        account = references.accounts.get(item.account)
+        if not account:
             raise ValueError('必填：账户')
         amount = item.amount
         if amount <= 0:
@@ -69,8 +179,8 @@ def _validate_input(input):
             amount = -amount
         currency = Currency.USD if item.currencyUS else Currency.RMB
         name = item.description.strip() if item.description and item.description.strip() else None
-        merge_entry = EntryModel.query.get(item.merge_entry) if item.merge_entry else None
-        if merge_entry and merge_entry.account_id != account.id:
-            merge_entry = None
+        merge_entry = references.entries.get(item.merge_entry)
+        if merge_entry and (merge_entry.account_id != account.id or not merge_entry.active):
+            merge_entry = None  # merged already by an earlier transaction of the batch
         items.append((account, amount, currency, name, merge_entry))
     return description, category, time, timezone, items
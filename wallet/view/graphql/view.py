@@ -0,0 +1,124 @@
+from collections import OrderedDict
+from functools import partial
+from hashlib import sha256
+
+from flask import Response, current_app, g, request
+from flask.json import dumps, loads
+from flask_graphql import GraphQLView
+from flask_login import current_user
+from graphql import execute, validate
+from graphql.backend.core import GraphQLCoreBackend
+from graphql.execution import ExecutionResult
+from graphql.language import ast
+from graphql_server import HttpQueryError
+
+from wallet.model.m1 import M1_UPDATED
+from wallet.util.ledger_version import ledger_version
+
+PERSISTED_QUERY_KEY = 'graphql:persisted-query:{}'
+RESPONSE_KEY = 'graphql:response:{}:{}:{}'
+RESPONSE_TTL = 3600
+CACHEABLE_FIELDS = {'accounts', 'categories', 'transactionTemplates', 'm1'}
+MAX_DOCUMENTS = 256
+
+
+class ValidatedBackend(GraphQLCoreBackend):
+    """ Parses and validates each distinct document once, keeping the most recently used ones. """
+
+    def __init__(self, size=MAX_DOCUMENTS):
+        super().__init__()
+        self.size = size
+        self.documents = OrderedDict()
+
+    def document_from_string(self, schema, document_string):
+        document = self.documents.get(document_string)
+        if document:
+            self.documents.move_to_end(document_string)
+            return document
+        document = super().document_from_string(schema, document_string)
+        errors = validate(schema, document.document_ast)
+        if errors:
+            document.execute = lambda *_, **__: ExecutionResult(errors=errors, invalid=True)
+        else:
+            document.execute = partial(execute, schema, document.document_ast, **self.execute_params)
+        self.documents[document_string] = document
+        if len(self.documents) > self.size:
+            self.documents.popitem(last=False)
+        return document
+
+
+class LedgerGraphQLView(GraphQLView):
+    """
+    Resolves persisted query hashes (the automatic persisted queries protocol) to documents,
+    and caches the responses of read-only queries per user until the user's ledger version changes.
+    """
+
+    def parse_body(self):
+        if 'graphql_body' not in g:
+            g.graphql_body = _resolve_persisted_query(super().parse_body())
+        return g.graphql_body
+
+    def dispatch_request(self):
+        try:
+            key = self._response_key()
+        except HttpQueryError:
+            key = None  # reported by dispatching
+        except Exception as e:  # never fail the request for its cache
+            current_app.logger.warning(f'failed to build the response cache key: {e!r}')
+            key = None
+        if key:
+            cached = current_app.redis.get(key)
+            if cached:
+                return Response(cached, content_type='application/json', headers={'X-Cache': 'HIT'})
+        response = super().dispatch_request()
+        if key and response.status_code == 200 and 'errors' not in loads(response.get_data()):
+            current_app.redis.set(key, response.get_data(), ex=RESPONSE_TTL)
+        return response
+
+    def _response_key(self):
+        data = self.parse_body()
+        if request.method != 'POST' or not isinstance(data, dict) or not data.get('query'):
+            return None
+        try:
+            document = self.get_backend().document_from_string(self.schema, data['query'])
+        except Exception:
+            return None  # reported by dispatching
+        fields = _query_fields(document.document_ast, data.get('operationName'))
+        if not fields or not fields <= CACHEABLE_FIELDS:
+            return None
+        versions = []
+        if 'm1' in fields:
+            updated = current_app.redis.hgetall(M1_UPDATED)
+            versions.append({name.decode(): value.decode() for name, value in updated.items()})
+        digest = sha256(dumps([data['query'], data.get('variables'), data.get('operationName'), *versions],
+                              sort_keys=True).encode()).hexdigest()
+        return RESPONSE_KEY.format(current_user.id, ledger_version(current_user.id), digest)
+
+
+def _resolve_persisted_query(data):
+    persisted = isinstance(data, dict) and (data.get('extensions') or {}).get('persistedQuery')
+    if not persisted:
+        return data
+    digest = persisted.get('sha256Hash', '')
+    if data.get('query'):
+        if sha256(data['query'].encode()).hexdigest() != digest:
+            raise HttpQueryError(400, 'provided sha does not match query')
+        current_app.redis.set(PERSISTED_QUERY_KEY.format(digest), data['query'])
+        return data
+    query = current_app.redis.get(PERSISTED_QUERY_KEY.format(digest))
+    if not query:
+        raise HttpQueryError(200, 'PersistedQueryNotFound')
+    return {**data, 'query': query.decode()}
+
+
+def _query_fields(document_ast, operation_name):
+    """ Top-level fields of the query operation, None for mutations or selections with fragments. """
+    operations = [d for d in document_ast.definitions if isinstance(d, ast.OperationDefinition)]
+    operation = next((o for o in operations if o.name and o.name.value == operation_name),
+                     operations[0] if len(operations) == 1 else None)
+    if not operation or operation.operation != 'query':
+        return None
+    selections = operation.selection_set.selections
+    if not all(isinstance(s, ast.Field) for s in selections):
+        return None
+    return {s.name.value for s in selections}
@@ -0,0 +1,27 @@
+from flask import Blueprint, jsonify, request
+from flask_login import login_required
+
+from wallet.util.http_client import http_stats
+from wallet.util.instrumentation import STATS_HOURS, rolling_stats
+from wallet.view.graphql.profiler import profiles, resolver_stats
+
+bp = Blueprint('stats', __name__)
+
+
+@bp.route('/sql')
+@login_required
+def sql():
+    return jsonify(rolling_stats(min(request.args.get('hours', STATS_HOURS, type=int), STATS_HOURS)))
+
+
+@bp.route('/graphql')
+@login_required
+def graphql():
+    hours = min(request.args.get('hours', STATS_HOURS, type=int), STATS_HOURS)
+    return jsonify({'resolvers': resolver_stats(hours), 'profiles': profiles()})
+
+
+@bp.route('/http')
+@login_required
+def http():
+    return jsonify(http_stats(min(request.args.get('hours', STATS_HOURS, type=int), STATS_HOURS)))
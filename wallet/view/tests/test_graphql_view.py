@@ -0,0 +1,76 @@
+from flask import current_app
+from flask.json import loads
+from flask_login import LoginManager, login_user
+from pytest import fixture
+
+from wallet.model.account import Account, AccountType
+from wallet.model.balance import AccountBalance
+from wallet.model.category import Category
+from wallet.model.m1 import M1_UPDATED
+from wallet.model.transaction import Transaction
+from wallet.view.graphql.schema import schema
+from wallet.view.graphql.view import LedgerGraphQLView, ValidatedBackend
+
+QUERY = '{ m1(limit: 5) }'
+ADD_TRANSACTIONS = '''mutation($inputs: [TransactionInput]!) {
+  addTransactions(inputs: $inputs) { ok results { ok error } }
+}'''
+
+
+@fixture
+def m1_updated(context):
+    """ The update times also version cached values elsewhere, restored after the test. """
+    saved = context.redis.hgetall(M1_UPDATED)
+    yield
+    pipeline = context.redis.pipeline()
+    pipeline.delete(M1_UPDATED)
+    if saved:
+        pipeline.hset(M1_UPDATED, mapping=saved)
+    pipeline.execute()
+
+
+def test_m1_query_cached(user, m1_updated):
+    app = current_app._get_current_object()
+    if not hasattr(app, 'login_manager'):
+        LoginManager(app)
+    view = LedgerGraphQLView(schema=schema, backend=ValidatedBackend())
+    app.redis.hset(M1_UPDATED, 'Individual', '2021-01-01T00:00:00')
+    responses = []
+    for _ in range(2):
+        with app.test_request_context('/q', method='POST', json={'query': QUERY}):
+            login_user(user)
+            key = view._response_key()
+            responses.append(view.dispatch_request())
+    assert key and all(response.status_code == 200 for response in responses)
+    assert responses[1].headers.get('X-Cache') == 'HIT'
+    assert loads(responses[0].get_data()) == loads(responses[1].get_data())
+
+    app.redis.hset(M1_UPDATED, 'Individual', '2021-01-02T00:00:00')
+    with app.test_request_context('/q', method='POST', json={'query': QUERY}):
+        login_user(user)
+        assert view._response_key() != key
+
+
+def test_add_transactions_partial(user):
+    app = current_app._get_current_object()
+    if not hasattr(app, 'login_manager'):
+        LoginManager(app)
+    account = Account.query.filter_by(user=user, type=AccountType.ASSET).first()
+    category = Category.query.filter_by(user=user).first()
+
+    def item(amount, usd=True, inflow=True):
+        return {'account': account.id, 'inflow': inflow, 'amount': amount, 'currencyUS': usd}
+
+    def transaction(description, *items):
+        return {'description': description, 'category': category.id, 'time': '2026-10-01T00:00:00',
+                'timezoneUS': True, 'items': list(items)}
+
+    inputs = [transaction('batch ok', item(1.)),
+              transaction('batch off rate', item(1.), item(1000., usd=False, inflow=False))]  # fails finish
+    with app.test_request_context('/q', method='POST'):
+        login_user(user)
+        result = schema.execute(ADD_TRANSACTIONS, variables={'inputs': inputs})
+    assert not result.errors
+    assert [r['ok'] for r in result.data['addTransactions']['results']] == [True, False]
+    assert not Transaction.query.filter_by(user=user, name='batch off rate').count()
+    assert not AccountBalance.verify()